@@ -1,6 +1,8 @@
 import streamlit as st
-import random
-import os
+
+from image_catalog import load_catalog
+from image_sampling import bucket_sample
+from image_thumbs import thumbnail
 
 # ==============================================================================
 # PAGE CONFIG
@@ -141,26 +143,24 @@ class StyleConfig:
 class ImageRecommender:
     @staticmethod
     def recommend(gender, style_scores, color_scores, max_images=3, min_weight=12):
-        base_dir = "ai_images"
+        catalog = load_catalog()
         gender_dir = "male" if gender == "male" else "female"
-        candidates = []
+        buckets = []
 
         for s, sv in style_scores.items():
             for c, cv in color_scores.items():
                 if sv + cv < min_weight:
                     continue
-                path = os.path.join(base_dir, gender_dir, s, c)
-                if os.path.exists(path):
-                    for f in os.listdir(path):
-                        if f.lower().endswith((".jpg", ".png")):
-                            candidates.append({
-                                "path": os.path.join(path, f),
-                                "style": s,
-                                "color": c,
-                                "weight": sv + cv
-                            })
-
-        return random.sample(candidates, min(len(candidates), max_images)) if candidates else []
+                files = catalog.files(gender_dir, s, c, extensions=(".jpg", ".png"))
+                if files:
+                    buckets.append((s, c, sv + cv, files))
+
+        # Uniform over all qualifying files = equal weight per bucket
+        picks = bucket_sample([len(b[3]) for b in buckets], [1] * len(buckets), max_images)
+        return [
+            {"path": buckets[b][3][i], "style": buckets[b][0], "color": buckets[b][1], "weight": buckets[b][2]}
+            for b, i in picks
+        ]
 
 # ==============================================================================
 # SIDEBAR
@@ -196,7 +196,7 @@ if "images" in st.session_state and st.session_state["images"]:
     cols = st.columns(3)
     for col, img in zip(cols, st.session_state["images"]):
         with col:
-            st.image(img["path"], use_container_width=True)
+            st.image(thumbnail(img["path"]), use_container_width=True)
             st.markdown(f"### {img['style']}")
             st.caption(f"{img['color']} · weight {img['weight']}")
 else:
@@ -1,6 +1,8 @@
 import streamlit as st
-import random
-import os
+
+from image_catalog import load_catalog
+from image_sampling import bucket_sample
+from image_thumbs import thumbnail
 
 # ==============================================================================
 # PAGE CONFIG
@@ -169,10 +171,11 @@ class StyleConfig:
 class ImageRecommender:
     @staticmethod
     def recommend(gender, style_scores, color_scores, max_images=3, min_weight=12):
-        base_dir = "ai_images"
+        catalog = load_catalog()
         gender_dir = "male" if gender == "male" else "female"
 
-        candidates = []
+        # One bucket per (style, color) folder; files are only touched once they are picked
+        buckets = []
 
         for style, s_score in style_scores.items():
             for color, c_score in color_scores.items():
@@ -180,30 +183,23 @@ class ImageRecommender:
                 if total_weight < min_weight:
                     continue
 
-                path = os.path.join(base_dir, gender_dir, style, color)
-                if os.path.exists(path):
-                    for file in os.listdir(path):
-                        if file.lower().endswith((".png", ".jpg", ".jpeg")):
-                            candidates.append({
-                                "path": os.path.join(path, file),
-                                "style": style,
-                                "color": color,
-                                "weight": total_weight
-                            })
-
-        if not candidates:
-            return []
-
-        selected = []
-        pool = candidates.copy()
+                files = catalog.files(gender_dir, style, color)
+                if files:
+                    buckets.append((style, color, total_weight, files))
 
-        while pool and len(selected) < max_images:
-            weights = [c["weight"] for c in pool]
-            choice = random.choices(pool, weights=weights, k=1)[0]
-            selected.append(choice)
-            pool.remove(choice)
+        if not buckets:
+            return []
 
-        return selected
+        picks = bucket_sample([len(b[3]) for b in buckets], [b[2] for b in buckets], max_images)
+        return [
+            {
+                "path": buckets[b][3][i],
+                "style": buckets[b][0],
+                "color": buckets[b][1],
+                "weight": buckets[b][2]
+            }
+            for b, i in picks
+        ]
 
 # ==============================================================================
 # SIDEBAR
@@ -259,7 +255,7 @@ def main():
 
         for col, img in zip(cols, st.session_state["images"]):
             with col:
-                st.image(img["path"], use_container_width=True)
+                st.image(thumbnail(img["path"]), use_container_width=True)
                 st.markdown(f"### {img['style']}")
                 st.caption(f"Color: {img['color']} | Total Weight: {img['weight']}")
 
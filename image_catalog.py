@@ -0,0 +1,247 @@
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+# ==============================================================================
+# IMAGE CATALOG
+# ai_images/<gender>/<style>/<color>/<file> is scanned once into a SQLite index
+# (path, gender, style, color, size, mtime). The UIs load it once per process and
+# look up images in memory instead of calling os.listdir on every click.
+# Each color folder's mtime is stored too, so refresh() only relists folders that changed.
+#
+#   python image_catalog.py scan --base-dir ai_images
+#   python image_catalog.py refresh
+#   IMAGE_CATALOG_WATCH=5 streamlit run "UI neon.py"   # poll for new images every 5 s
+# ==============================================================================
+
+BASE_DIR = "ai_images"
+CATALOG_PATH = os.environ.get("IMAGE_CATALOG", "image_catalog.sqlite")
+WATCH_INTERVAL = float(os.environ.get("IMAGE_CATALOG_WATCH", 0))  # seconds, 0 = no watcher
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path   TEXT PRIMARY KEY,
+    gender TEXT NOT NULL,
+    style  TEXT NOT NULL,
+    color  TEXT NOT NULL,
+    size   INTEGER NOT NULL,
+    mtime  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_group ON images (gender, style, color);
+CREATE TABLE IF NOT EXISTS dirs (
+    path   TEXT PRIMARY KEY,
+    gender TEXT NOT NULL,
+    style  TEXT NOT NULL,
+    color  TEXT NOT NULL,
+    mtime  REAL NOT NULL
+);
+"""
+
+
+def connect(db_path=CATALOG_PATH):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _subdirs(path):
+    try:
+        return sorted(entry.name for entry in os.scandir(path) if entry.is_dir())
+    except FileNotFoundError:
+        return []
+
+
+def walk_dirs(base_dir=BASE_DIR):
+    # Only directories are touched here: one (folder, gender, style, color, mtime) per color folder
+    for gender in _subdirs(base_dir):
+        for style in _subdirs(os.path.join(base_dir, gender)):
+            for color in _subdirs(os.path.join(base_dir, gender, style)):
+                folder = os.path.join(base_dir, gender, style, color)
+                yield folder, gender, style, color, os.stat(folder).st_mtime
+
+
+def list_images(folder, gender, style, color):
+    # One row per image file, using the same relative paths the UIs pass to st.image
+    rows = []
+    for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            stat = entry.stat()
+            rows.append((os.path.join(folder, entry.name), gender, style, color,
+                         stat.st_size, stat.st_mtime))
+    return rows
+
+
+def scan(base_dir=BASE_DIR, db_path=CATALOG_PATH):
+    # Full rebuild: the old rows are replaced in a single transaction
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM images")
+            conn.execute("DELETE FROM dirs")
+            for folder, gender, style, color, mtime in walk_dirs(base_dir):
+                conn.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?)",
+                                 list_images(folder, gender, style, color))
+                conn.execute("INSERT INTO dirs VALUES (?, ?, ?, ?, ?)", (folder, gender, style, color, mtime))
+        return conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def refresh(base_dir=BASE_DIR, db_path=CATALOG_PATH, full=False):
+    # Relists only the color folders that are new or whose mtime changed, and applies the difference.
+    # Adding, deleting or renaming a file bumps its folder's mtime; overwriting an image in place
+    # does not, so full=True relists every folder to pick up those modifications as well.
+    changes = {"added": 0, "removed": 0, "modified": 0}
+    conn = connect(db_path)
+    try:
+        with conn:
+            stored = dict(conn.execute("SELECT path, mtime FROM dirs"))
+            current = set()
+            for folder, gender, style, color, mtime in walk_dirs(base_dir):
+                current.add(folder)
+                if not full and stored.get(folder) == mtime:
+                    continue
+                old = {path: (size, file_mtime) for path, size, file_mtime in conn.execute(
+                    "SELECT path, size, mtime FROM images WHERE gender = ? AND style = ? AND color = ?",
+                    (gender, style, color))}
+                new = list_images(folder, gender, style, color)
+                upserts = [row for row in new if old.get(row[0]) != row[4:]]
+                gone = old.keys() - {row[0] for row in new}
+                conn.executemany("INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)", upserts)
+                conn.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in gone])
+                conn.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)",
+                             (folder, gender, style, color, mtime))
+                changes["added"] += sum(1 for row in upserts if row[0] not in old)
+                changes["modified"] += sum(1 for row in upserts if row[0] in old)
+                changes["removed"] += len(gone)
+
+            for folder in stored.keys() - current:
+                gender, style, color = conn.execute(
+                    "SELECT gender, style, color FROM dirs WHERE path = ?", (folder,)).fetchone()
+                changes["removed"] += conn.execute(
+                    "DELETE FROM images WHERE gender = ? AND style = ? AND color = ?",
+                    (gender, style, color)).rowcount
+                conn.execute("DELETE FROM dirs WHERE path = ?", (folder,))
+        return changes
+    finally:
+        conn.close()
+
+
+# ==============================================================================
+# IN-MEMORY CATALOG
+# ==============================================================================
+class Catalog:
+    def __init__(self, rows):
+        self.groups = {}
+        self._filtered = {}
+        for path, gender, style, color in rows:
+            self.groups.setdefault((gender, style, color), []).append(path)
+
+    def __len__(self):
+        return sum(len(paths) for paths in self.groups.values())
+
+    def files(self, gender, style, color, extensions=None):
+        # With extensions, the filtered list is built once per folder and reused by later requests
+        paths = self.groups.get((gender, style, color), [])
+        if extensions is None:
+            return paths
+        key = (gender, style, color, tuple(extensions))
+        filtered = self._filtered.get(key)
+        if filtered is None:
+            filtered = self._filtered[key] = [p for p in paths if p.lower().endswith(tuple(extensions))]
+        return filtered
+
+    @classmethod
+    def read(cls, db_path=CATALOG_PATH):
+        conn = connect(db_path)
+        try:
+            return cls(conn.execute("SELECT path, gender, style, color FROM images ORDER BY path"))
+        finally:
+            conn.close()
+
+
+_catalogs = {}
+_watchers = {}
+_lock = threading.Lock()
+
+
+def load_catalog(db_path=CATALOG_PATH, base_dir=BASE_DIR):
+    # Loaded once per process; the index is built on first use if the scan command was never run
+    with _lock:
+        catalog = _catalogs.get(db_path)
+        if catalog is None:
+            if not os.path.exists(db_path):
+                scan(base_dir, db_path)
+            catalog = _catalogs[db_path] = Catalog.read(db_path)
+    if WATCH_INTERVAL:
+        start_watcher(WATCH_INTERVAL, db_path, base_dir)
+    return catalog
+
+
+def reload_catalog(db_path=CATALOG_PATH, base_dir=BASE_DIR, full=False):
+    # Applies refresh() and swaps in a new in-memory catalog only when something changed
+    changes = refresh(base_dir, db_path, full=full)
+    if any(changes.values()):
+        catalog = Catalog.read(db_path)
+        with _lock:
+            _catalogs[db_path] = catalog
+    return changes
+
+
+def _watch(interval, db_path, base_dir):
+    while True:
+        time.sleep(interval)
+        try:
+            reload_catalog(db_path, base_dir)
+        except (OSError, sqlite3.Error):
+            # A folder vanishing mid-walk or a locked database: try again on the next tick
+            continue
+
+
+def start_watcher(interval=5.0, db_path=CATALOG_PATH, base_dir=BASE_DIR):
+    # One polling thread per catalog file; each tick only stats the directories
+    with _lock:
+        watcher = _watchers.get(db_path)
+        if watcher is None:
+            watcher = threading.Thread(target=_watch, args=(interval, db_path, base_dir),
+                                       name=f"catalog-watch-{db_path}", daemon=True)
+            _watchers[db_path] = watcher
+            watcher.start()
+        return watcher
+
+
+def clear_cache():
+    with _lock:
+        _catalogs.clear()
+
+
+# ==============================================================================
+# CLI
+# ==============================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index ai_images for the outfit recommender UIs")
+    sub = parser.add_subparsers(dest="command", required=True)
+    scan_parser = sub.add_parser("scan", help="rebuild the catalog from the image tree")
+    refresh_parser = sub.add_parser("refresh", help="apply only the changes since the last scan")
+    refresh_parser.add_argument("--full", action="store_true",
+                                help="relist every folder (catches images overwritten in place)")
+    for command_parser in (scan_parser, refresh_parser):
+        command_parser.add_argument("--base-dir", default=BASE_DIR, help="image root directory")
+        command_parser.add_argument("--db", default=CATALOG_PATH, help="catalog file")
+    args = parser.parse_args(argv)
+
+    if args.command == "scan":
+        count = scan(args.base_dir, args.db)
+        print(f"indexed {count:,} images from {args.base_dir} into {args.db}")
+    else:
+        start = time.perf_counter()
+        changes = refresh(args.base_dir, args.db, full=args.full)
+        print(f"+{changes['added']} -{changes['removed']} ~{changes['modified']} images"
+              f" ({time.perf_counter() - start:.3f}s)")
+
+
+if __name__ == "__main__":
+    main()
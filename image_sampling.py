@@ -0,0 +1,170 @@
+import argparse
+import itertools
+import random
+import time
+
+import numpy as np
+
+# ==============================================================================
+# WEIGHTED SAMPLING WITHOUT REPLACEMENT
+# Efraimidis–Spirakis: item i gets the key log(u_i) / w_i (u_i uniform in (0, 1));
+# the k largest keys, in descending order, have exactly the distribution of drawing
+# one item at a time with probability proportional to the remaining weights
+# (the random.choices + pool.remove loop the UIs used). One vectorised pass over the
+# weights plus an argpartition, instead of k list rebuilds and scans.
+#
+# bucket_sample does the same over buckets of equally weighted files (one bucket per
+# style x color folder): a bucket is drawn with probability count x weight over what is
+# left, then a file index uniformly inside it. The cost depends on the number of buckets,
+# not on the number of files, and no per-file list is ever built.
+#
+#   python image_sampling.py check   # chi-square test against the exact distribution
+#   python image_sampling.py bench   # timings for n = 10^3 .. 10^6
+# ==============================================================================
+
+_rng = np.random.default_rng()
+
+
+def weighted_sample(weights, k, rng=None):
+    # Returns up to k indices in pick order; zero-weight items are never picked
+    rng = _rng if rng is None else np.random.default_rng(rng)
+    weights = np.asarray(weights, dtype=np.float64)
+    positive = np.flatnonzero(weights > 0)
+    k = min(k, len(positive))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+    keys = np.log(rng.random(len(positive))) / weights[positive]
+    top = np.argpartition(keys, len(keys) - k)[len(keys) - k:]
+    return positive[top[np.argsort(keys[top])[::-1]]]
+
+
+def bucket_sample(counts, weights, k, rng=None):
+    # Returns up to k (bucket, file index) pairs in pick order, with the same probabilities as
+    # weighted_sample over every file (a file's weight being its bucket's weight)
+    rng = _rng if rng is None else np.random.default_rng(rng)
+    remaining = np.asarray(counts, dtype=np.float64).copy()
+    weights = np.asarray(weights, dtype=np.float64)
+    taken = {}
+    picks = []
+    for _ in range(k):
+        mass = remaining * weights
+        total = mass.sum()
+        if total <= 0:
+            break
+        bucket = min(int(np.searchsorted(np.cumsum(mass), rng.random() * total, side="right")),
+                     len(mass) - 1)
+        # The r-th file of the bucket that has not been picked yet
+        index = int(rng.integers(remaining[bucket]))
+        for prev in sorted(taken.get(bucket, [])):
+            if prev <= index:
+                index += 1
+        taken.setdefault(bucket, []).append(index)
+        remaining[bucket] -= 1
+        picks.append((bucket, index))
+    return picks
+
+
+def sequential_sample(weights, k, rng=None):
+    # The original loop, kept as the reference for check and bench
+    rng = random.Random(rng)
+    pool = list(range(len(weights)))
+    selected = []
+    while pool and len(selected) < k:
+        choice = rng.choices(pool, weights=[weights[i] for i in pool], k=1)[0]
+        selected.append(choice)
+        pool.remove(choice)
+    return selected
+
+
+# ==============================================================================
+# CHECK
+# ==============================================================================
+def exact_probabilities(weights, k):
+    # Probability of every ordered pick sequence under successive sampling
+    total = sum(weights)
+    probs = {}
+    for seq in itertools.permutations(range(len(weights)), k):
+        p, remaining = 1.0, total
+        for i in seq:
+            p *= weights[i] / remaining
+            remaining -= weights[i]
+        probs[seq] = p
+    return probs
+
+
+def chi_square_critical(dof, alpha=0.001):
+    # Wilson–Hilferty approximation of the chi-square quantile (z = 3.09 for alpha = 0.001)
+    z = {0.01: 2.326, 0.001: 3.090}[alpha]
+    return dof * (1 - 2 / (9 * dof) + z * np.sqrt(2 / (9 * dof))) ** 3
+
+
+def _chi_square(sample, probs, trials, seed):
+    counts = dict.fromkeys(probs, 0)
+    rng = np.random.default_rng(seed)
+    for _ in range(trials):
+        counts[tuple(sample(rng))] += 1
+    stat = sum((counts[seq] - trials * p) ** 2 / (trials * p) for seq, p in probs.items())
+    return stat, chi_square_critical(len(probs) - 1)
+
+
+def check(weights=(1, 2, 3, 5, 8, 13), k=3, trials=200_000, seed=0):
+    probs = exact_probabilities(list(weights), k)
+    return _chi_square(lambda rng: [int(i) for i in weighted_sample(weights, k, rng)], probs, trials, seed)
+
+
+def check_buckets(counts=(1, 3, 2), weights=(4, 1, 3), k=3, trials=200_000, seed=0):
+    # Files are numbered bucket by bucket; the exact probabilities are those of the flat weights
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    flat = [w for c, w in zip(counts, weights) for _ in range(c)]
+    probs = exact_probabilities(flat, k)
+    return _chi_square(lambda rng: [int(offsets[b] + i) for b, i in bucket_sample(counts, weights, k, rng)],
+                       probs, trials, seed)
+
+
+# ==============================================================================
+# BENCH
+# ==============================================================================
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(sizes=(10**3, 10**4, 10**5, 10**6), k=3, repeat=5, buckets=40):
+    # n files spread over 5 styles x 8 colors, each folder with one weight in 12..20
+    rng = np.random.default_rng(0)
+    print(f"{'n':>10}{'sequential (ms)':>18}{'exp keys (ms)':>16}{'buckets (ms)':>15}")
+    for n in sizes:
+        bucket_weights = rng.integers(12, 21, buckets).astype(np.float64)
+        counts = np.bincount(rng.integers(0, buckets, n), minlength=buckets)
+        weights = np.repeat(bucket_weights, counts)
+        as_list = weights.tolist()
+        seq = _best(lambda: sequential_sample(as_list, k), repeat)
+        fast = _best(lambda: weighted_sample(weights, k), repeat)
+        bucket = _best(lambda: bucket_sample(counts, bucket_weights, k), repeat)
+        print(f"{n:>10,}{seq * 1e3:>18.3f}{fast * 1e3:>16.3f}{bucket * 1e3:>15.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check and benchmark the image sampler")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_parser = sub.add_parser("check", help="chi-square test against the exact pick distribution")
+    check_parser.add_argument("--trials", type=int, default=200_000)
+    bench_parser = sub.add_parser("bench", help="time sequential, exponential-key and bucket sampling")
+    bench_parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        for name, test in (("weighted_sample", check), ("bucket_sample", check_buckets)):
+            stat, critical = test(trials=args.trials)
+            print(f"{name}: chi-square {stat:.1f} (critical {critical:.1f} at alpha=0.001):"
+                  f" {'ok' if stat < critical else 'FAILED'}")
+    else:
+        bench(repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
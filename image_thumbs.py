@@ -0,0 +1,175 @@
+import argparse
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+from image_catalog import CATALOG_PATH, connect, load_catalog
+
+# ==============================================================================
+# THUMBNAILS
+# Every catalog image gets WebP renditions (JPEG if Pillow has no WebP support) at a
+# few widths, stored by content hash: .thumbs/<ab>/<sha256>-<width>.webp. Identical
+# images share files and an edited image gets new ones. The thumbs table in the
+# catalog maps path + size + mtime to the hash, so serving a thumbnail costs one stat.
+#
+#   python image_thumbs.py build --workers 4
+# ==============================================================================
+
+THUMB_DIR = os.environ.get("IMAGE_THUMB_DIR", ".thumbs")
+WIDTHS = (320, 640, 1280)
+GALLERY_WIDTH = 640  # one of three columns on a wide page, at 2x pixel density
+FORMAT, EXTENSION = ("WEBP", "webp") if features.check("webp") else ("JPEG", "jpg")
+QUALITY = 80
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbs (
+    path   TEXT PRIMARY KEY,
+    size   INTEGER NOT NULL,
+    mtime  REAL NOT NULL,
+    digest TEXT NOT NULL
+);
+"""
+
+
+def pick_width(width):
+    # Smallest rendition at least as wide as requested, else the largest one
+    return next((w for w in WIDTHS if w >= width), WIDTHS[-1])
+
+
+def rendition_path(digest, width, thumb_dir=THUMB_DIR):
+    return os.path.join(thumb_dir, digest[:2], f"{digest}-{width}.{EXTENSION}")
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _save(image, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if FORMAT == "JPEG":
+        image.convert("RGB").save(tmp, FORMAT, quality=QUALITY, optimize=True, progressive=True)
+    else:
+        image.save(tmp, FORMAT, quality=QUALITY, method=4)
+    os.replace(tmp, path)
+
+
+def render(path, thumb_dir=THUMB_DIR):
+    # Decodes the original once and writes every missing width; never upscales
+    stat = os.stat(path)
+    digest = _digest(path)
+    missing = [w for w in WIDTHS if not os.path.exists(rendition_path(digest, w, thumb_dir))]
+    if missing:
+        with Image.open(path) as image:
+            # JPEG originals are decoded directly at a reduced scale
+            widest = max(missing)
+            image.draft("RGB", (widest, -(-image.height * widest // image.width)))
+            image.load()
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            for w in sorted(missing, reverse=True):
+                if image.width > w:
+                    image = image.resize((w, round(image.height * w / image.width)), Image.LANCZOS)
+                _save(image, rendition_path(digest, w, thumb_dir))
+    return path, stat.st_size, stat.st_mtime, digest
+
+
+def _render_task(task):
+    return render(*task)
+
+
+def _connect(db_path):
+    conn = connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _record(rows, db_path):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+
+
+def build(db_path=CATALOG_PATH, thumb_dir=THUMB_DIR, workers=None):
+    # Renders every catalog image whose thumbnails are missing or out of date, in parallel
+    catalog = load_catalog(db_path)  # before the manifest, which would create an empty catalog file
+    known = _read_manifest(db_path)
+    todo = []
+    for paths in catalog.groups.values():
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(path, (None, None, None))[:2] != (stat.st_size, stat.st_mtime):
+                todo.append((path, thumb_dir))
+    if not todo:
+        return []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(_render_task, todo, chunksize=8))
+    _record(rows, db_path)
+    with _lock:
+        _manifests.pop(db_path, None)
+    return rows
+
+
+# ==============================================================================
+# SERVING
+# ==============================================================================
+_manifests = {}
+_lock = threading.Lock()
+
+
+def _read_manifest(db_path):
+    conn = _connect(db_path)
+    try:
+        return {path: (size, mtime, digest) for path, size, mtime, digest in
+                conn.execute("SELECT path, size, mtime, digest FROM thumbs")}
+    finally:
+        conn.close()
+
+
+def thumbnail(path, width=GALLERY_WIDTH, db_path=CATALOG_PATH, thumb_dir=THUMB_DIR):
+    # Path of the rendition to hand to st.image; images added since the last build are rendered here
+    with _lock:
+        manifest = _manifests.get(db_path)
+        if manifest is None:
+            manifest = _manifests[db_path] = _read_manifest(db_path)
+    stat = os.stat(path)
+    entry = manifest.get(path)
+    if entry is None or entry[:2] != (stat.st_size, stat.st_mtime) \
+            or not os.path.exists(rendition_path(entry[2], pick_width(width), thumb_dir)):
+        row = render(path, thumb_dir)
+        _record([row], db_path)
+        entry = manifest[path] = row[1:]
+    return rendition_path(entry[2], pick_width(width), thumb_dir)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate gallery thumbnails for the catalog images")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="render missing or outdated thumbnails")
+    build_parser.add_argument("--db", default=CATALOG_PATH, help="catalog file")
+    build_parser.add_argument("--out", default=THUMB_DIR, help="thumbnail cache directory")
+    build_parser.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    rows = build(args.db, args.out, args.workers)
+    elapsed = time.perf_counter() - start
+    original = sum(size for _, size, _, _ in rows)
+    served = sum(os.path.getsize(rendition_path(digest, GALLERY_WIDTH, args.out)) for *_, digest in rows)
+    print(f"rendered {len(rows):,} images in {elapsed:.2f}s;"
+          f" {original / 1e6:.1f} MB originals -> {served / 1e6:.1f} MB at {GALLERY_WIDTH}px")
+
+
+if __name__ == "__main__":
+    main()
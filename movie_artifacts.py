@@ -0,0 +1,132 @@
+import json
+import os
+import time
+
+import numpy as np
+
+from movie_retrieval import normalize_rows
+
+
+# ==============================================================================
+# 学習済み因子の保存と読み込み
+# models/<版>/U.npy, V.npy, V_norm.npy（行を正規化した V）, columns.json, meta.json と、
+# 最新版を指す models/LATEST。--feedback で再学習した版には、学習に使ったアプリからの評価を
+# feedback_base.f32 として残し、次の再学習へ引き継ぐ
+# ==============================================================================
+
+MODEL_DIR = os.environ.get("MOVIE_MODEL_DIR", "models")
+FEEDBACK_BASE = "feedback_base.f32"
+
+
+def _write_text(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def save_artifact(U, V, columns, meta, root=MODEL_DIR, feedback=None):
+    base = time.strftime("%Y%m%d-%H%M%S")
+    if meta.get("dataset_version"):
+        base += "-" + meta["dataset_version"][:8]
+    # 既存の版は他のプロセスがメモリマップで開いているかもしれないので、上書きせず別名にする
+    os.makedirs(root, exist_ok=True)
+    name, suffix = base, 1
+    while True:
+        path = os.path.join(root, name)
+        try:
+            os.makedirs(path, exist_ok=False)
+            break
+        except FileExistsError:
+            suffix += 1
+            name = f"{base}-{suffix}"
+
+    np.save(os.path.join(path, "U.npy"), np.ascontiguousarray(U))
+    np.save(os.path.join(path, "V.npy"), np.ascontiguousarray(V))
+    np.save(os.path.join(path, "V_norm.npy"), normalize_rows(V))
+    _write_text(os.path.join(path, "columns.json"),
+                json.dumps([str(c) for c in columns], ensure_ascii=False))
+    _write_text(os.path.join(path, "meta.json"),
+                json.dumps(dict(meta, name=name), ensure_ascii=False, indent=2))
+    if feedback is not None and len(feedback):
+        tmp = os.path.join(path, f"{FEEDBACK_BASE}.{os.getpid()}.tmp")
+        np.asarray(feedback, dtype=np.float32).tofile(tmp)
+        os.replace(tmp, os.path.join(path, FEEDBACK_BASE))
+
+    # 全ファイルを書き終えてから LATEST を切り替える
+    _write_text(os.path.join(root, "LATEST"), name)
+    return path
+
+
+def latest_name(root=MODEL_DIR):
+    pointer = os.path.join(root, "LATEST")
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, encoding="utf-8") as f:
+        return f.read().strip() or None
+
+
+def load_artifact(name=None, root=MODEL_DIR):
+    # U と V はメモリマップで開くので、複数プロセスで同じページを共有できる
+    name = name or latest_name(root)
+    if name is None:
+        return None
+    path = os.path.join(root, name)
+    with open(os.path.join(path, "columns.json"), encoding="utf-8") as f:
+        columns = json.load(f)
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    V_norm_path = os.path.join(path, "V_norm.npy")
+    return {
+        "U": np.load(os.path.join(path, "U.npy"), mmap_mode="r"),
+        "V": np.load(os.path.join(path, "V.npy"), mmap_mode="r"),
+        "V_norm": np.load(V_norm_path, mmap_mode="r") if os.path.exists(V_norm_path) else None,
+        "columns": columns,
+        "meta": meta,
+    }
+
+
+def _save_arrays(name, arrays, root):
+    path = os.path.join(root, name)
+    for filename, array in arrays.items():
+        tmp = os.path.join(path, f"{filename}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp, os.path.join(path, filename))
+
+
+def _load_pair(name, prefix, root):
+    path = os.path.join(root, name)
+    items_path = os.path.join(path, f"{prefix}_items.npy")
+    if not os.path.exists(items_path):
+        return None
+    return {
+        "items": np.load(items_path, mmap_mode="r"),
+        "scores": np.load(os.path.join(path, f"{prefix}_scores.npy"), mmap_mode="r"),
+    }
+
+
+# ==============================================================================
+# 既存の評価者ごとの推薦表（precompute_movie_recs.py で作る）
+# recs_items.npy（評価者 × N の映画番号、-1 は該当なし）と recs_scores.npy
+# ==============================================================================
+
+def save_recommendations(name, items, scores, root=MODEL_DIR):
+    _save_arrays(name, {"recs_items.npy": items, "recs_scores.npy": scores}, root)
+
+
+def load_recommendations(name, root=MODEL_DIR):
+    return _load_pair(name, "recs", root)
+
+
+# ==============================================================================
+# 映画ごとの近傍表（precompute_movie_recs.py --neighbors で作る）
+# neighbors_items.npy（映画 × K の映画番号）と neighbors_scores.npy（コサイン類似度）
+# ==============================================================================
+
+def save_neighbors(name, items, scores, root=MODEL_DIR):
+    _save_arrays(name, {"neighbors_items.npy": items, "neighbors_scores.npy": scores}, root)
+
+
+def load_neighbors(name, root=MODEL_DIR):
+    return _load_pair(name, "neighbors", root)
@@ -0,0 +1,265 @@
+import argparse
+import json
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from movie_data import default_source, load_ratings
+from movie_hogwild import train_hogwild
+from movie_mf import init_factors, to_sparse, train_als, train_gd, train_gd_fast, train_gd_sparse, train_warm
+from movie_retrieval import ItemIndex, top_k, top_k_rows
+from movie_sweep import holdout_split
+
+
+# ==============================================================================
+# ベンチマーク: python movie_bench.py kernel / retrieval / accuracy
+# ==============================================================================
+
+def synthetic_ratings(n, D, density=0.1, M=4, noise=0.5, rng=None):
+    # 低ランク構造 + ノイズの 1〜10 点評価。density の割合だけ観測される
+    rng = np.random.default_rng(rng)
+    U = rng.normal(1, 0.3, (n, M))
+    V = rng.normal(1, 0.3, (D, M))
+    R = np.clip(np.rint(np.dot(U, V.T) + rng.normal(0, noise, (n, D))), 1, 10)
+    R[rng.random((n, D)) >= density] = np.nan
+    return R
+
+
+def stable_lr(R, lr=0.001):
+    # 1 行・1 列あたりの評価数が多いと lr=0.001 では発散するので小さくする
+    observed = ~np.isnan(R)
+    most = max(observed.sum(axis=0).max(), observed.sum(axis=1).max(), 1)
+    return min(lr, 0.1 / most)
+
+
+def epochs_per_second(train, R, epochs, **kwargs):
+    U, V = init_factors(R.shape[0], R.shape[1], 4, rng=0)
+    start = time.perf_counter()
+    train(R, E=epochs, U=U, V=V, lr=stable_lr(R), **kwargs)
+    return epochs / (time.perf_counter() - start)
+
+
+def bench_kernel(args):
+    datasets = []
+    try:
+        datasets.append(("movie_rate", load_ratings(args.source or default_source()).values))
+    except OSError as e:
+        print(f"movie_rate: 読み込めないためスキップ ({e})")
+    datasets.append(("synthetic 1k x 1k", synthetic_ratings(1000, 1000, rng=0)))
+    datasets.append(("synthetic 10k x 2k", synthetic_ratings(10000, 2000, rng=0)))
+
+    kernels = [
+        ("train_gd", train_gd, {}),
+        ("train_gd_fast float64", train_gd_fast, {"dtype": np.float64}),
+        ("train_gd_fast float32", train_gd_fast, {"dtype": np.float32}),
+    ]
+    print(f"{'dataset':<22}{'kernel':<24}{'epochs/s':>12}")
+    for name, R in datasets:
+        # 大きい行列では反復回数を減らす
+        epochs = max(1, min(args.epochs, int(args.epochs * 1e5 / R.size)))
+        for kernel_name, train, kwargs in kernels:
+            rate = epochs_per_second(train, R, epochs, **kwargs)
+            print(f"{name:<22}{kernel_name:<24}{rate:>12.1f}")
+
+
+def _latency(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def bench_retrieval(args):
+    # D = 10^3 〜 max_items の映画に対する上位 k 件取得の 1 回あたりの時間（ミリ秒）
+    rng = np.random.default_rng(0)
+    print(f"{'D':>9}{'pandas sort':>14}{'argpartition':>14}{'ivf':>10}{'recall':>8}")
+    D = 1000
+    while D <= args.max_items:
+        V = rng.normal(1, 0.25, (D, args.factors))
+        user_vec = rng.normal(1, 0.25, args.factors)
+        exclude = rng.random(D) < 0.01
+        names = pd.Index([f"m{i}" for i in range(D)])
+        repeat = max(3, int(1e6 / D))
+
+        def pandas_sort():
+            pred = pd.Series(np.dot(V, user_vec), index=names)
+            return pred[~exclude].sort_values(ascending=False).head(args.k)
+
+        exact = ItemIndex(V)
+        t_pandas = _latency(pandas_sort, repeat)
+        t_exact = _latency(lambda: top_k(exact.scores(user_vec), args.k, exclude), repeat)
+
+        ivf = ItemIndex(V, nlist=max(1, int(np.sqrt(D))), rng=0)
+        nprobe = max(1, len(ivf.centroids) // 10)
+        t_ivf = _latency(lambda: ivf.search(user_vec, args.k, exclude, nprobe=nprobe), repeat)
+        truth = set(exact.search(user_vec, args.k, exclude)[0])
+        found = set(ivf.search(user_vec, args.k, exclude, nprobe=nprobe)[0])
+        recall = len(truth & found) / max(len(truth), 1)
+
+        print(f"{D:>9}{t_pandas:>14.3f}{t_exact:>14.3f}{t_ivf:>10.3f}{recall:>8.2f}")
+        D *= 10
+
+
+# 精度ベンチマークで比べる学習方法（名前 -> (R_train, args) から学習結果を返す関数）
+ACCURACY_SOLVERS = {
+    "als": lambda R, a: train_warm(train_als, R, M=a.factors, k=a.k, tol=a.tol, rng=0),
+    "als_random": lambda R, a: train_als(R, M=a.factors, k=a.k, tol=a.tol, rng=0),
+    "gd_fast": lambda R, a: train_warm(train_gd_fast, R, M=a.factors, k=a.k, lr=stable_lr(R),
+                                       E=a.epochs, tol=a.tol, rng=0),
+    "gd_fast_f32": lambda R, a: train_warm(train_gd_fast, R, M=a.factors, k=a.k, lr=stable_lr(R),
+                                           E=a.epochs, tol=a.tol, rng=0, dtype=np.float32),
+    "gd_sparse": lambda R, a: train_gd_sparse(to_sparse(R), M=a.factors, k=a.k, lr=stable_lr(R),
+                                              E=a.epochs, tol=a.tol, rng=0),
+    "hogwild": lambda R, a: train_hogwild(to_sparse(R), M=a.factors, k=0.05, lr=0.01,
+                                          epochs=a.sgd_epochs, rng=0),
+}
+
+
+def precision_at_k(U, V, R_train, test, k=5, top_fraction=0.2, block=1024):
+    # 学習に使っていない映画の上位 k 件のうち、検証用に取り分けた高評価の割合
+    # 高評価は点数の絶対値ではなく、ユーザーごとに取り分けた評価の上位 top_fraction とする
+    # （合成データの評価は中央付近に集まるので、固定の閾値だとほとんど誰も該当しない）
+    rows, cols, vals = test
+    relevant = np.zeros(R_train.shape, dtype=bool)
+    cutoff = pd.Series(vals).groupby(rows).transform(lambda v: v.quantile(1 - top_fraction)).to_numpy()
+    good = vals >= cutoff
+    relevant[rows[good], cols[good]] = True
+    users = np.flatnonzero(relevant.any(axis=1))
+    if len(users) == 0:
+        return float("nan")
+    hits = 0
+    for start in range(0, len(users), block):
+        block_users = users[start:start + block]
+        scores = np.dot(np.asarray(U[block_users], dtype=np.float64), np.asarray(V, dtype=np.float64).T)
+        idx, _ = top_k_rows(scores, k, exclude=~np.isnan(R_train[block_users]))
+        hits += np.take_along_axis(relevant[block_users], np.maximum(idx, 0), axis=1)[idx >= 0].sum()
+    return float(hits / (len(users) * k))
+
+
+def _test_rmse(U, V, test):
+    rows, cols, vals = test
+    pred = np.einsum("ij,ij->i", np.asarray(U, dtype=np.float64)[rows], np.asarray(V, dtype=np.float64)[cols])
+    return float(np.sqrt(np.mean((vals - pred) ** 2)))
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_accuracy(args):
+    R = synthetic_ratings(args.users, args.movies, density=args.density, M=args.rank,
+                          noise=args.noise, rng=args.seed)
+    R_train, test = holdout_split(R, args.holdout, rng=args.seed)
+
+    results = []
+    for name in args.solvers:
+        # 時間は tracemalloc なしで測り、メモリは別にもう 1 回学習して測る（tracemalloc は遅くなる）
+        start = time.perf_counter()
+        with np.errstate(over="ignore", invalid="ignore"):
+            result = ACCURACY_SOLVERS[name](R_train, args)
+        seconds = time.perf_counter() - start
+
+        # tracemalloc は NumPy の配列確保も数える（hogwild のワーカープロセスは含まない）
+        tracemalloc.start()
+        with np.errstate(over="ignore", invalid="ignore"):
+            ACCURACY_SOLVERS[name](R_train, args)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results.append({
+            "solver": name,
+            "seconds": seconds,
+            "peak_mb": peak / 2 ** 20,
+            "iterations": int(result["iterations"]),
+            "train_rmse": float(result["rmse"]),
+            "test_rmse": _test_rmse(result["U"], result["V"], test),
+            f"precision_at_{args.top}": precision_at_k(result["U"], result["V"], R_train, test,
+                                                        k=args.top, top_fraction=args.relevant),
+        })
+
+    report = {
+        "commit": _git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "dataset": {"users": args.users, "movies": args.movies, "density": args.density,
+                    "rank": args.rank, "noise": args.noise, "holdout": args.holdout, "seed": args.seed},
+        "params": {"factors": args.factors, "k": args.k, "tol": args.tol, "epochs": args.epochs},
+        "results": results,
+    }
+    print(pd.DataFrame(results).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"saved {args.report}")
+    if args.compare:
+        compare_reports(args.compare, report)
+
+
+def compare_reports(path, report):
+    # 以前のレポートと同じ学習方法どうしで差を表示する（新 - 旧）
+    with open(path, encoding="utf-8") as f:
+        old = json.load(f)
+    if old.get("dataset") != report["dataset"]:
+        print("注意: データの設定が異なるレポートとの比較です")
+    old_results = {r["solver"]: r for r in old["results"]}
+    rows = []
+    for new in report["results"]:
+        prev = old_results.get(new["solver"])
+        if prev is None:
+            continue
+        rows.append({key: new[key] if key == "solver" else new[key] - prev.get(key, np.nan)
+                     for key in new})
+    print(f"\n{old.get('commit')} -> {report['commit']} の差")
+    print(pd.DataFrame(rows).to_string(index=False, float_format=lambda x: f"{x:+.4f}"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="映画推薦の学習ベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    kernel = sub.add_parser("kernel", help="勾配法カーネルの epochs/s を比較する")
+    kernel.add_argument("--source", default=None, help="評価データ（既定は movie_rate.xlsx）")
+    kernel.add_argument("--epochs", type=int, default=2000)
+    kernel.set_defaults(func=bench_kernel)
+
+    retrieval = sub.add_parser("retrieval", help="上位 k 件取得の時間を比較する")
+    retrieval.add_argument("--max-items", type=int, default=1_000_000)
+    retrieval.add_argument("--factors", type=int, default=4)
+    retrieval.add_argument("-k", type=int, default=3)
+    retrieval.set_defaults(func=bench_retrieval)
+
+    accuracy = sub.add_parser("accuracy", help="合成データで時間・メモリ・反復回数・精度を測る")
+    accuracy.add_argument("--users", type=int, default=2000)
+    accuracy.add_argument("--movies", type=int, default=500)
+    accuracy.add_argument("--density", type=float, default=0.1)
+    accuracy.add_argument("--rank", type=int, default=4, help="合成データの真のランク")
+    accuracy.add_argument("--noise", type=float, default=0.5)
+    accuracy.add_argument("--holdout", type=float, default=0.2)
+    accuracy.add_argument("--solvers", nargs="+", choices=list(ACCURACY_SOLVERS),
+                          default=["als", "als_random", "gd_fast", "gd_sparse"])
+    accuracy.add_argument("--factors", type=int, default=4)
+    accuracy.add_argument("-k", type=float, default=0.5)
+    accuracy.add_argument("--tol", type=float, default=1e-4)
+    accuracy.add_argument("--epochs", type=int, default=20000)
+    accuracy.add_argument("--sgd-epochs", type=int, default=20)
+    accuracy.add_argument("--top", type=int, default=5, help="precision@k の k")
+    accuracy.add_argument("--relevant", type=float, default=0.2,
+                          help="高評価とみなす割合（ユーザーごとの取り分けた評価の上位）")
+    accuracy.add_argument("--seed", type=int, default=0)
+    accuracy.add_argument("--report", default=None, help="JSON レポートの保存先")
+    accuracy.add_argument("--compare", default=None, help="比較する以前の JSON レポート")
+    accuracy.set_defaults(func=bench_accuracy)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+
+# 評価データの取得元（環境変数 MOVIE_RATE_SOURCE でローカルファイルに差し替え可能）
+MOVIE_RATE_URL = "https://github.com/aimathstats/dataviz1/raw/refs/heads/main/data/movie_rate.xlsx"
+CACHE_DIR = os.environ.get("MOVIE_CACHE_DIR", ".movie_cache")
+
+# プロセス全体で共有するキャッシュ（source -> {"stamp", "version", "frame"}）
+_cache = {}
+_lock = threading.Lock()
+
+
+def default_source():
+    return os.environ.get("MOVIE_RATE_SOURCE", MOVIE_RATE_URL)
+
+
+def _is_url(source):
+    return source.startswith(("http://", "https://"))
+
+
+def _stamp(source):
+    # ローカルファイルは mtime とサイズで変更を検知する。URL はプロセス内で一度だけ取得する
+    if _is_url(source):
+        return None
+    stat = os.stat(source)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _read_bytes(source):
+    if _is_url(source):
+        with urllib.request.urlopen(source) as res:
+            return res.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _parse(source, data):
+    # 拡張子で読み込み方法を選ぶ（既定は Excel）
+    path = source.split("?", 1)[0].lower()
+    if path.endswith(".csv"):
+        return pd.read_csv(io.BytesIO(data))
+    if path.endswith(".parquet"):
+        return pd.read_parquet(io.BytesIO(data))
+    return pd.read_excel(io.BytesIO(data))
+
+
+def _snapshot_paths(version, cache_dir):
+    base = os.path.join(cache_dir, f"ratings-{version}")
+    return base + ".npy", base + ".json"
+
+
+def _load_snapshot(version, cache_dir):
+    values_path, columns_path = _snapshot_paths(version, cache_dir)
+    if not (os.path.exists(values_path) and os.path.exists(columns_path)):
+        return None
+    with open(columns_path, encoding="utf-8") as f:
+        columns = json.load(f)
+    values = np.load(values_path)
+    return pd.DataFrame(values, columns=columns)
+
+
+def _write_snapshot(frame, version, cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    values_path, columns_path = _snapshot_paths(version, cache_dir)
+    # 途中で落ちても壊れたスナップショットが残らないよう、一時ファイルから置き換える
+    tmp_values = f"{values_path}.{os.getpid()}.tmp"
+    with open(tmp_values, "wb") as f:
+        np.save(f, frame.to_numpy(dtype=np.float64))
+    os.replace(tmp_values, values_path)
+    tmp_columns = f"{columns_path}.{os.getpid()}.tmp"
+    with open(tmp_columns, "w", encoding="utf-8") as f:
+        json.dump([str(c) for c in frame.columns], f, ensure_ascii=False)
+    os.replace(tmp_columns, columns_path)
+
+
+def _load_entry(source, cache_dir):
+    stamp = _stamp(source)
+    entry = _cache.get(source)
+    if entry is not None and entry["stamp"] == stamp:
+        return entry
+
+    data = _read_bytes(source)
+    version = hashlib.sha256(data).hexdigest()[:16]
+    if entry is not None and entry["version"] == version:
+        # 中身が同じなら mtime だけ更新する
+        entry["stamp"] = stamp
+        return entry
+
+    frame = _load_snapshot(version, cache_dir)
+    if frame is None:
+        frame = _parse(source, data)
+        _write_snapshot(frame, version, cache_dir)
+
+    entry = {"stamp": stamp, "version": version, "frame": frame}
+    _cache[source] = entry
+    return entry
+
+
+def load_ratings(source=None, cache_dir=CACHE_DIR):
+    # 評価表（行: 評価者、列: 映画、未評価は NaN）を返す。呼び出し側で書き換えないこと
+    source = source or default_source()
+    with _lock:
+        return _load_entry(source, cache_dir)["frame"]
+
+
+def dataset_version(source=None, cache_dir=CACHE_DIR):
+    # 評価データの内容ハッシュ。学習結果のキャッシュキーに使う
+    source = source or default_source()
+    with _lock:
+        return _load_entry(source, cache_dir)["version"]
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
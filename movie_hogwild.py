@@ -0,0 +1,92 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from movie_mf import init_factors, sparse_rmse, to_sparse
+
+
+# ==============================================================================
+# Hogwild 方式の確率的勾配法
+# 評価 (ユーザー, 映画, 評価値) を複数プロセスに分け、共有メモリ上の U と V を
+# ロックなしで更新する。まれに同じ行を同時に書き換えても収束には影響しない
+# ==============================================================================
+
+def _create(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    return shm, view
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _spec(shm, array):
+    return (shm.name, array.shape, array.dtype.str)
+
+
+def _sgd_worker(task):
+    # 担当範囲の評価を小さなバッチに分け、各バッチの勾配を共有の U, V に直接書き込む
+    handles = [_attach(spec) for spec in task["arrays"]]
+    rows, cols, vals, U, V = (array for _, array in handles)
+    rng = np.random.default_rng(task["seed"])
+    lr, k, batch = task["lr"], task["k"], task["batch"]
+    shard = np.arange(task["start"], task["stop"])
+    try:
+        for _ in range(task["epochs"]):
+            rng.shuffle(shard)
+            for b in range(0, len(shard), batch):
+                idx = shard[b:b + batch]
+                r, c = rows[idx], cols[idx]
+                Ur, Vc = U[r], V[c]
+                error = vals[idx] - np.einsum("ij,ij->i", Ur, Vc)
+                np.add.at(U, r, lr * (error[:, None] * Vc - k * Ur))
+                np.add.at(V, c, lr * (error[:, None] * Ur - k * Vc))
+    finally:
+        del rows, cols, vals, U, V
+        for shm, _ in handles:
+            shm.close()
+    return len(shard) * task["epochs"]
+
+
+def train_hogwild(S, M=4, k=0.05, lr=0.01, epochs=20, workers=None, batch=256,
+                  U=None, V=None, rng=None):
+    if not isinstance(S, dict):
+        S = to_sparse(S)
+    n, D = S["shape"]
+    if U is None or V is None:
+        U, V = init_factors(n, D, M, rng)
+    workers = workers or os.cpu_count()
+
+    # 評価をシャッフルしてから、プロセスごとに連続した範囲を割り当てる
+    order = np.random.default_rng(rng).permutation(len(S["vals"]))
+    arrays = [S["rows"][order], S["cols"][order], S["vals"][order],
+              np.ascontiguousarray(U, dtype=np.float64), np.ascontiguousarray(V, dtype=np.float64)]
+    shared = [_create(a) for a in arrays]
+    try:
+        specs = [_spec(shm, view) for shm, view in shared]
+        bounds = np.linspace(0, len(order), workers + 1).astype(int)
+        tasks = [{"arrays": specs, "start": bounds[w], "stop": bounds[w + 1], "epochs": epochs,
+                  "lr": lr, "k": k, "batch": batch, "seed": None if rng is None else rng + w}
+                 for w in range(workers)]
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            processed = sum(pool.map(_sgd_worker, tasks))
+        seconds = time.perf_counter() - start
+
+        U = shared[3][1].copy()
+        V = shared[4][1].copy()
+    finally:
+        for shm, _ in shared:
+            shm.close()
+            shm.unlink()
+
+    return {"U": U, "V": V, "iterations": epochs, "rmse": sparse_rmse(S, U, V),
+            "seconds": seconds, "ratings_per_second": processed / seconds if seconds else 0.0}
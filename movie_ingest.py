@@ -0,0 +1,238 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+# ==============================================================================
+# 大きな評価データの取り込み: python movie_ingest.py ratings.csv --out ingested
+# 縦持ち (user, movie, rating) のファイルを少しずつ読み、ID を連番に振り直して
+# ディスク上の CSR（indptr / indices / data）を作る。メモリ使用量は chunksize で決まる
+# ==============================================================================
+
+COO_FILES = (("coo_rows.i32", np.int32), ("coo_cols.i32", np.int32), ("coo_vals.f32", np.float32))
+
+
+def _read_ids(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {key: i for i, key in enumerate(json.load(f))}
+
+
+def _write_ids(path, ids):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(list(ids), f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _map_ids(values, ids):
+    # 既知の ID は辞書から、初めての ID には続きの番号を振る
+    keys = [str(v) for v in values]
+    for key in dict.fromkeys(keys):
+        if key not in ids:
+            ids[key] = len(ids)
+    return np.fromiter((ids[key] for key in keys), dtype=np.int32, count=len(keys))
+
+
+def iter_chunks(path, columns, chunksize):
+    if path.lower().endswith(".parquet"):
+        import pyarrow.parquet as pq  # Parquet を読むときだけ必要
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def _coo_lengths(out_dir):
+    return [os.path.getsize(os.path.join(out_dir, name)) // np.dtype(dtype).itemsize
+            if os.path.exists(os.path.join(out_dir, name)) else 0
+            for name, dtype in COO_FILES]
+
+
+def _repair_coo(out_dir):
+    # 途中で落ちて 3 つのファイルの長さがずれていたら、そろっているところまで切り詰める
+    n = min(_coo_lengths(out_dir))
+    for name, dtype in COO_FILES:
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path) and os.path.getsize(path) != n * np.dtype(dtype).itemsize:
+            os.truncate(path, n * np.dtype(dtype).itemsize)
+    return n
+
+
+def _append_chunk(out_dir, arrays):
+    # チャンクはいったん一時ファイルに書き切ってから本体の末尾に足す
+    tmps = []
+    for (name, _), array in zip(COO_FILES, arrays):
+        tmp = os.path.join(out_dir, f"{name}.{os.getpid()}.tmp")
+        array.tofile(tmp)
+        tmps.append(tmp)
+    for (name, _), tmp in zip(COO_FILES, tmps):
+        with open(os.path.join(out_dir, name), "ab") as f, open(tmp, "rb") as src:
+            shutil.copyfileobj(src, f)
+    for tmp in tmps:
+        os.remove(tmp)
+
+
+def append_coo(paths, out_dir, user_col="user", movie_col="movie", rating_col="rating",
+               chunksize=1_000_000):
+    # 読み込んだ評価を coo_*.i32 / coo_*.f32 に追記する。ID の辞書は users.json / movies.json に残す
+    # 同じ (ユーザー, 映画) が何度出てきても build_csr で最後の評価だけが残るので、同じファイルを取り込み直してもよい
+    os.makedirs(out_dir, exist_ok=True)
+    _repair_coo(out_dir)
+    users = _read_ids(os.path.join(out_dir, "users.json"))
+    movies = _read_ids(os.path.join(out_dir, "movies.json"))
+    added = 0
+    for path in paths:
+        for chunk in iter_chunks(path, [user_col, movie_col, rating_col], chunksize):
+            chunk = chunk.dropna(subset=[rating_col])
+            arrays = (_map_ids(chunk[user_col].to_numpy(), users),
+                      _map_ids(chunk[movie_col].to_numpy(), movies),
+                      chunk[rating_col].to_numpy(dtype=np.float32))
+            # ID の辞書を先に書く（落ちても評価のない ID が残るだけ）
+            _write_ids(os.path.join(out_dir, "users.json"), users)
+            _write_ids(os.path.join(out_dir, "movies.json"), movies)
+            _append_chunk(out_dir, arrays)
+            added += len(chunk)
+    return added, len(users), len(movies)
+
+
+def build_csr(out_dir, n_users, n_movies, chunksize=1_000_000):
+    # COO を 2 回なめて CSR を作る。1 回目で行ごとの件数、2 回目で書き込み位置を決める
+    # そのあと行ごとに列でそろえて重複する (行, 列) は最後の評価だけ残し、中身から版を作る
+    nnz = _repair_coo(out_dir)
+    rows_raw, cols_raw, vals_raw = (
+        np.memmap(os.path.join(out_dir, name), dtype=dtype, mode="r")
+        if nnz else np.empty(0, dtype=dtype)
+        for name, dtype in COO_FILES
+    )
+
+    counts = np.zeros(n_users, dtype=np.int64)
+    for start in range(0, nnz, chunksize):
+        counts += np.bincount(rows_raw[start:start + chunksize], minlength=n_users)
+    indptr = np.zeros(n_users + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+
+    open_memmap = np.lib.format.open_memmap
+    raw_paths = [os.path.join(out_dir, name) for name in ("indices.raw.npy", "data.raw.npy")]
+    indices = open_memmap(raw_paths[0], mode="w+", dtype=np.int32, shape=(nnz,))
+    data = open_memmap(raw_paths[1], mode="w+", dtype=np.float32, shape=(nnz,))
+    filled = np.zeros(n_users, dtype=np.int64)
+    for start in range(0, nnz, chunksize):
+        rows = np.asarray(rows_raw[start:start + chunksize])
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        # 同じ行の中で何番目か（チャンク内）+ それまでに書いた件数 = 行内の位置（取り込んだ順のまま）
+        first = np.searchsorted(sorted_rows, sorted_rows, side="left")
+        pos = indptr[sorted_rows] + filled[sorted_rows] + (np.arange(len(rows)) - first)
+        indices[pos] = cols_raw[start:start + chunksize][order]
+        data[pos] = vals_raw[start:start + chunksize][order]
+        filled += np.bincount(rows, minlength=n_users)
+
+    # 重複の除去。行のまとまりごとに読み、詰めた結果を同じ配列の前のほうへ書き戻す（書く位置 <= 読む位置）
+    kept = np.zeros(n_users, dtype=np.int64)
+    write = 0
+    r0 = 0
+    while r0 < n_users:
+        r1 = max(int(np.searchsorted(indptr, indptr[r0] + chunksize, side="right")) - 1, r0 + 1)
+        lo, hi = indptr[r0], indptr[r1]
+        local = np.repeat(np.arange(r0, r1), counts[r0:r1])
+        cols = np.asarray(indices[lo:hi])
+        vals = np.asarray(data[lo:hi])
+        order = np.lexsort((cols, local))  # 安定ソートなので同じ (行, 列) は取り込んだ順に並ぶ
+        local, cols, vals = local[order], cols[order], vals[order]
+        last = np.ones(len(cols), dtype=bool)
+        last[:-1] = (local[1:] != local[:-1]) | (cols[1:] != cols[:-1])
+        n = int(last.sum())
+        indices[write:write + n] = cols[last]
+        data[write:write + n] = vals[last]
+        kept[r0:r1] = np.bincount(local[last] - r0, minlength=r1 - r0)
+        write += n
+        r0 = r1
+    np.cumsum(kept, out=indptr[1:])
+
+    # 詰めた先頭部分を本番のファイルへ写しながら、中身（形・indptr・indices・data）から版を作る
+    # （indices と data は別々にハッシュするので、版は chunksize に依らない）
+    indices_hash, data_hash = hashlib.sha256(), hashlib.sha256()
+    final_indices = open_memmap(os.path.join(out_dir, "indices.npy"), mode="w+", dtype=np.int32, shape=(write,))
+    final_data = open_memmap(os.path.join(out_dir, "data.npy"), mode="w+", dtype=np.float32, shape=(write,))
+    for start in range(0, write, chunksize):
+        stop = min(start + chunksize, write)
+        block_indices = np.asarray(indices[start:stop])
+        block_data = np.asarray(data[start:stop])
+        final_indices[start:stop] = block_indices
+        final_data[start:stop] = block_data
+        indices_hash.update(block_indices.tobytes())
+        data_hash.update(block_data.tobytes())
+    final_indices.flush()
+    final_data.flush()
+    del indices, data, final_indices, final_data
+    for path in raw_paths:
+        os.remove(path)
+    np.save(os.path.join(out_dir, "indptr.npy"), indptr)
+
+    digest = hashlib.sha256(f"{n_users},{n_movies}".encode() + indptr.tobytes()
+                            + indices_hash.digest() + data_hash.digest()).hexdigest()[:16]
+    meta = {"shape": [n_users, n_movies], "nnz": int(write), "version": digest}
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def ingest(paths, out_dir, chunksize=1_000_000, **columns):
+    added, n_users, n_movies = append_coo(paths, out_dir, chunksize=chunksize, **columns)
+    meta = build_csr(out_dir, n_users, n_movies, chunksize=chunksize)
+    return dict(meta, added=added)
+
+
+def load_csr(out_dir):
+    with open(os.path.join(out_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    with open(os.path.join(out_dir, "movies.json"), encoding="utf-8") as f:
+        movies = json.load(f)
+    return {
+        "indptr": np.load(os.path.join(out_dir, "indptr.npy"), mmap_mode="r"),
+        "indices": np.load(os.path.join(out_dir, "indices.npy"), mmap_mode="r"),
+        "data": np.load(os.path.join(out_dir, "data.npy"), mmap_mode="r"),
+        "shape": tuple(meta["shape"]),
+        "version": meta["version"],
+        "movies": movies,
+    }
+
+
+def csr_to_sparse(csr):
+    # movie_mf の疎な学習（train_gd_sparse / train_hogwild）で使う COO 形式にする
+    indptr = np.asarray(csr["indptr"])
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    return {
+        "rows": rows,
+        "cols": np.asarray(csr["indices"]),
+        "vals": np.asarray(csr["data"], dtype=np.float64),
+        "shape": csr["shape"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="縦持ちの評価ファイルを取り込み、ディスク上の疎行列を作る")
+    parser.add_argument("paths", nargs="+", help="CSV / Parquet ファイル")
+    parser.add_argument("--out", default="ingested", help="出力先ディレクトリ（既存なら追記）")
+    parser.add_argument("--user-col", default="user")
+    parser.add_argument("--movie-col", default="movie")
+    parser.add_argument("--rating-col", default="rating")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    args = parser.parse_args(argv)
+
+    meta = ingest(args.paths, args.out, chunksize=args.chunksize, user_col=args.user_col,
+                  movie_col=args.movie_col, rating_col=args.rating_col)
+    print(f"added {meta['added']:,} ratings -> {meta['shape'][0]:,} users x {meta['shape'][1]:,} movies,"
+          f" {meta['nnz']:,} ratings in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # 入っていなければ BLAS のスレッド数は環境変数（OMP_NUM_THREADS など）任せ
+    threadpool_limits = None
+
+
+# ==============================================================================
+# バックグラウンド学習ジョブ
+# 同じキー（データの版 + 学習方法）のジョブはプロセス内で 1 つだけ動かし、
+# 後から来たセッションは同じジョブの結果を待つ
+# 新しい版のジョブが来たら、同じ学習方法の古い版の終わったジョブは捨てる（因子を持ち続けない）
+# 同時に走る学習は MAX_JOBS 個まで、1 ジョブの BLAS スレッドは BLAS_THREADS 本まで
+# （MAX_JOBS × BLAS_THREADS がコア数を超えないようにする）
+# ==============================================================================
+
+MAX_JOBS = max(1, int(os.environ.get("MOVIE_MAX_JOBS", 2)))
+BLAS_THREADS = max(1, int(os.environ.get("MOVIE_BLAS_THREADS", 0)) or (os.cpu_count() or 1) // MAX_JOBS)
+
+_slots = threading.BoundedSemaphore(MAX_JOBS)
+_blas_lock = threading.Lock()
+_blas_users = 0
+_blas_limits = None
+
+
+@contextmanager
+def blas_threads(n):
+    # threadpoolctl の上限はプロセス全体に効く（スレッドごとではない）。
+    # 重なって走るジョブの途中で元に戻さないよう、最初に入ったジョブが設定し、最後に出たジョブが戻す
+    # （重なっている間は最初のジョブの n が全体に効く）
+    global _blas_users, _blas_limits
+    if threadpool_limits is None or not n:
+        yield
+        return
+    with _blas_lock:
+        if _blas_users == 0:
+            _blas_limits = threadpool_limits(limits=n, user_api="blas")
+        _blas_users += 1
+    try:
+        yield
+    finally:
+        with _blas_lock:
+            _blas_users -= 1
+            if _blas_users == 0:
+                _blas_limits.restore_original_limits()
+                _blas_limits = None
+
+
+class TrainingJob:
+    def __init__(self, key, train, kwargs, total, threads=None):
+        self.key = key
+        self.status = "pending"   # pending（空き待ち）/ running / done / error
+        self.progress = 0.0
+        self.partial = None       # 途中経過（プレビュー用）
+        self.result = None
+        self.error = None
+        self._train = train
+        self._kwargs = kwargs
+        self._total = max(total, 1)
+        self._time_budget = kwargs.get("time_budget")
+        self._threads = threads or BLAS_THREADS
+        self._started = None
+        self._thread = threading.Thread(target=self._run, name=f"train-{key}", daemon=True)
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        self._thread.join(timeout)
+        return self.result
+
+    def _run(self):
+        # 空きができるまで pending のまま待つ（time_budget は走り始めてから数える）
+        with _slots:
+            self._started = time.perf_counter()
+            self.status = "running"
+            try:
+                with blas_threads(self._threads):
+                    result = self._train(callback=self._report, **self._kwargs)
+            except Exception as e:
+                self.error = e
+                self.status = "error"
+                return
+        self.result = result
+        self.partial = None       # 結果が出たらプレビューは要らない
+        self.progress = 1.0
+        self.status = "done"
+
+    def _report(self, iterations, loss, U, V):
+        # 反復回数と経過時間のうち、上限に近いほうを進捗とする
+        fraction = iterations / self._total
+        if self._time_budget:
+            fraction = max(fraction, (time.perf_counter() - self._started) / self._time_budget)
+        self.progress = min(fraction, 0.99)
+        self.partial = {
+            "iterations": iterations,
+            "loss": loss,
+            "user_mean": U.mean(axis=0),
+            "V": V.copy(),
+        }
+
+
+_jobs = {}
+_lock = threading.Lock()
+
+
+def submit(key, train, kwargs, total, threads=None):
+    # key は (データの版, 学習方法...)。実行中・完了済みの同じキーのジョブがあればそれを返す
+    # （失敗したジョブは作り直す）
+    with _lock:
+        job = _jobs.get(key)
+        if job is None or job.status == "error":
+            _drop_stale(key)
+            job = TrainingJob(key, train, kwargs, total, threads=threads)
+            _jobs[key] = job
+            job.start()
+        return job
+
+
+def _drop_stale(key):
+    # 学習方法が同じで版が違う、終わったジョブを捨てる。走っているジョブは次の submit で捨てる
+    # （結果を待っているセッションはジョブへの参照を持っているので、ここで消しても困らない）
+    for other in [k for k, job in _jobs.items() if k[1:] == key[1:] and k != key and job.done]:
+        del _jobs[other]
+
+
+def get_job(key):
+    with _lock:
+        return _jobs.get(key)
@@ -0,0 +1,325 @@
+import time
+
+import numpy as np
+
+
+# ==============================================================================
+# 行列分解（R ≒ U V^T、未評価は NaN）
+# 目的関数: 観測セルの二乗誤差 + k * (|U|^2 + |V|^2)
+# ==============================================================================
+
+def masked_rmse(R, U, V):
+    observed = ~np.isnan(R)
+    if not observed.any():
+        return 0.0
+    error = (R - np.dot(U, V.T))[observed]
+    return float(np.sqrt(np.mean(error ** 2)))
+
+
+def _objective(R0, W, U, V, k):
+    error = (R0 - np.dot(U, V.T)) * W
+    return float(np.sum(error ** 2) + k * (np.sum(U ** 2) + np.sum(V ** 2)))
+
+
+def _penalty(U, V, k):
+    return k * (float(np.vdot(U, U)) + float(np.vdot(V, V)))
+
+
+def _stop_reason(curve, tol, start, time_budget):
+    # 損失が増えたか有限でなくなったら発散、相対改善が 0 以上 tol 以下なら収束、
+    # 経過時間が time_budget を超えたら打ち切り
+    if curve:
+        loss = curve[-1][1]
+        if not np.isfinite(loss):
+            return "diverged"
+        if len(curve) >= 2:
+            prev = curve[-2][1]
+            # 丸め誤差ぶんの増加（相対 1e-6 まで、float32 の ALS でも起こる）は増えたとみなさない
+            if loss > prev + 1e-6 * abs(prev):
+                return "diverged"
+            if tol is not None and prev - loss <= tol * max(abs(prev), 1e-12):
+                return "converged"
+    if time_budget is not None and time.perf_counter() - start >= time_budget:
+        return "time_budget"
+    return None
+
+
+def init_factors(n, D, M, rng=None):
+    rng = np.random.default_rng(rng)
+    U = rng.normal(1, 0.25, (n, M))
+    V = rng.normal(1, 0.25, (D, M))
+    return U, V
+
+
+def svd_factors(R, M=4, oversample=10, power_iters=2, rng=None):
+    # 未評価を列平均（列に評価がなければ全体平均）で埋め、ランダム化 SVD で上位 M 成分を求める
+    # U = U_M sqrt(S), V = V_M sqrt(S) とすれば U V^T が埋めた行列の最良の低ランク近似になる
+    R = np.asarray(R, dtype=np.float64)
+    observed = ~np.isnan(R)
+    overall = R[observed].mean() if observed.any() else 0.0
+    counts = observed.sum(axis=0)
+    col_mean = np.where(counts > 0, np.where(observed, R, 0).sum(axis=0) / np.maximum(counts, 1), overall)
+    X = np.where(observed, R, col_mean)
+
+    rng = np.random.default_rng(rng)
+    width = min(M + oversample, min(X.shape))
+    Q, _ = np.linalg.qr(np.dot(X, rng.normal(size=(X.shape[1], width))))
+    for _ in range(power_iters):
+        Q, _ = np.linalg.qr(np.dot(X.T, Q))
+        Q, _ = np.linalg.qr(np.dot(X, Q))
+    Ub, S, Vt = np.linalg.svd(np.dot(Q.T, X), full_matrices=False)
+
+    M_eff = min(M, len(S))
+    root = np.sqrt(S[:M_eff])
+    U = np.zeros((X.shape[0], M))
+    V = np.zeros((X.shape[1], M))
+    U[:, :M_eff] = np.dot(Q, Ub[:, :M_eff]) * root
+    V[:, :M_eff] = Vt[:M_eff].T * root
+    return U, V
+
+
+def warm_factors(R, U_prev, V_prev, k=0.5):
+    # 前回の因子を初期値として使う。増えた行（ユーザー）・列（映画）だけ fold-in で補う
+    R = np.asarray(R, dtype=np.float64)
+    n, D = R.shape
+    n_prev, D_prev = min(len(U_prev), n), min(len(V_prev), D)
+    M = U_prev.shape[1]
+    U = np.empty((n, M))
+    V = np.empty((D, M))
+    U[:n_prev] = U_prev[:n_prev]
+    V[:D_prev] = V_prev[:D_prev]
+    for j in range(D_prev, D):
+        V[j] = fold_in(U[:n_prev], R[:n_prev, j], k)
+    for i in range(n_prev, n):
+        U[i] = fold_in(V, R[i], k)
+    return U, V
+
+
+def train_warm(train, R, M=4, k=0.5, prev=None, init="svd", **kwargs):
+    # 前回の因子 prev（{"U", "V"}）があれば warm_factors、なければ init（"svd" / "random"）から train を始める
+    # SVD の初期値で反復が減るのは ALS だけ。勾配法は乱数の初期値のほうが早く収束する
+    #（movie_rate, tol=1e-4: ALS 49 回 vs 乱数 64〜66 回、勾配法 3900 回 vs 乱数 1900〜2900 回）
+    if prev is not None and prev["U"].shape[1] == M:
+        U, V = warm_factors(R, prev["U"], prev["V"], k)
+    elif init == "random":
+        U, V = init_factors(*np.shape(R), M, kwargs.get("rng"))
+    else:
+        U, V = svd_factors(R, M, rng=kwargs.get("rng"))
+    return train(R, M=M, k=k, U=U, V=V, **kwargs)
+
+
+def train_gd(R, M=4, k=0.5, lr=0.001, E=20000, U=None, V=None, rng=None):
+    # 元の全バッチ勾配法（誤差逆伝播法）
+    R = np.asarray(R, dtype=np.float64)
+    n, D = R.shape
+    if U is None or V is None:
+        U, V = init_factors(n, D, M, rng)
+
+    for _ in range(E):
+        error = R - np.dot(U, V.T)
+        error[np.isnan(R)] = 0
+        gradU = 2 * np.dot(error, V) - 2 * k * U
+        gradV = 2 * np.dot(error.T, U) - 2 * k * V
+        U += lr * gradU
+        V += lr * gradV
+
+    return {"U": U, "V": V, "iterations": E, "rmse": masked_rmse(R, U, V)}
+
+
+def train_gd_fast(R, M=4, k=0.5, lr=0.001, E=20000, U=None, V=None, rng=None, dtype=np.float64,
+                  check_every=100, tol=None, time_budget=None, callback=None):
+    # train_gd と同じ更新式。マスクと 0 埋めの評価行列は最初に一度だけ作り、
+    # 反復中は確保済みのバッファに out= で書き込むので新しい配列を作らない
+    # check_every 回ごとに損失を記録し、tol（相対改善）か time_budget（秒）で早期終了する
+    # callback(反復回数, 損失, U, V) は損失を記録するたびに呼ばれる（進捗表示用）
+    start = time.perf_counter()
+    R = np.asarray(R, dtype=np.float64)
+    dtype = np.dtype(dtype)
+    n, D = R.shape
+    if U is None or V is None:
+        U, V = init_factors(n, D, M, rng)
+    U = np.array(U, dtype=dtype, order="C")
+    V = np.array(V, dtype=dtype, order="C")
+
+    observed = ~np.isnan(R)
+    W = observed.astype(dtype)
+    R0 = np.where(observed, R, 0).astype(dtype)
+
+    error = np.empty((n, D), dtype=dtype)
+    gradU = np.empty((n, M), dtype=dtype)
+    gradV = np.empty((D, M), dtype=dtype)
+    decay = dtype.type(1 - 2 * lr * k)
+    step = dtype.type(2 * lr)
+
+    curve = []
+    reason = "max_iter"
+    iterations = 0
+    while iterations < E:
+        np.dot(U, V.T, out=error)
+        np.subtract(R0, error, out=error)
+        np.multiply(error, W, out=error)
+        if check_every and iterations % check_every == 0:
+            curve.append((iterations, float(np.vdot(error, error)) + _penalty(U, V, k)))
+            if callback:
+                callback(iterations, curve[-1][1], U, V)
+            stop = _stop_reason(curve, tol, start, None)
+            if stop:
+                reason = stop
+                break
+        np.dot(error, V, out=gradU)
+        np.dot(error.T, U, out=gradV)
+        # U += lr * (2 * error V - 2 k U)  を  U = U (1 - 2 lr k) + 2 lr * error V  として計算
+        U *= decay
+        gradU *= step
+        U += gradU
+        V *= decay
+        gradV *= step
+        V += gradV
+        iterations += 1
+        if _stop_reason([], None, start, time_budget):
+            reason = "time_budget"
+            break
+
+    return {"U": U, "V": V, "iterations": iterations, "rmse": masked_rmse(R, U, V),
+            "loss_curve": curve, "stop_reason": reason}
+
+
+def _ridge_rows(R0, W, F, k):
+    # 各行 i について (F_o^T F_o + kI) x_i = F_o^T r_i をまとめて解く（F_o は観測列だけ）
+    M = F.shape[1]
+    FF = (F[:, :, None] * F[:, None, :]).reshape(len(F), M * M)
+    A = np.dot(W, FF).reshape(-1, M, M) + k * np.eye(M, dtype=F.dtype)
+    b = np.dot(R0, F)
+    return np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+
+def train_als(R, M=4, k=0.5, max_iter=100, tol=1e-4, U=None, V=None, rng=None, time_budget=None,
+              callback=None, dtype=np.float64):
+    # 交互最小二乗法。U と V を交互にリッジ回帰の閉形式解で更新する
+    # dtype=np.float32 にすると行列積と連立方程式を単精度で解く（RMSE は float64 で測る）
+    start = time.perf_counter()
+    R = np.asarray(R, dtype=np.float64)
+    n, D = R.shape
+    dtype = np.dtype(dtype)
+    if U is None or V is None:
+        U, V = init_factors(n, D, M, rng)
+    U = np.asarray(U, dtype=dtype)
+    V = np.asarray(V, dtype=dtype)
+    # k = 0 でも評価のない行が特異にならないよう、ごく小さな正則化を下限にする
+    k = max(k, 1e-9)
+
+    W = (~np.isnan(R)).astype(dtype)
+    R0 = np.where(W > 0, R, 0.0).astype(dtype)
+
+    curve = [(0, _objective(R0, W, U, V, k))]
+    reason = "max_iter"
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        U = _ridge_rows(R0, W, V, k)
+        V = _ridge_rows(R0.T, W.T, U, k)
+        curve.append((iterations, _objective(R0, W, U, V, k)))
+        if callback:
+            callback(iterations, curve[-1][1], U, V)
+        stop = _stop_reason(curve, tol, start, time_budget)
+        if stop:
+            reason = stop
+            break
+
+    return {"U": U, "V": V, "iterations": iterations, "rmse": masked_rmse(R, U, V),
+            "loss_curve": curve, "stop_reason": reason}
+
+
+# ==============================================================================
+# 疎な学習（観測された (ユーザー, 映画, 評価) の組だけを持つ COO 形式）
+# メモリと計算量はユーザー数 × 映画数ではなく評価数に比例する
+# ==============================================================================
+
+def sparse_ratings(rows, cols, vals, shape):
+    order = np.lexsort((cols, rows))  # 行優先（CSR と同じ並び）にしておく
+    return {
+        "rows": np.asarray(rows, dtype=np.int32)[order],
+        "cols": np.asarray(cols, dtype=np.int32)[order],
+        "vals": np.asarray(vals, dtype=np.float64)[order],
+        "shape": (int(shape[0]), int(shape[1])),
+    }
+
+
+def to_sparse(R):
+    R = np.asarray(R, dtype=np.float64)
+    rows, cols = np.nonzero(~np.isnan(R))
+    return sparse_ratings(rows, cols, R[rows, cols], R.shape)
+
+
+def sparse_rmse(S, U, V):
+    if len(S["vals"]) == 0:
+        return 0.0
+    pred = np.einsum("ij,ij->i", U[S["rows"]], V[S["cols"]])
+    return float(np.sqrt(np.mean((S["vals"] - pred) ** 2)))
+
+
+def _scatter_rows(index, contrib, size):
+    # contrib の各行を index ごとに足し合わせる（因子ごとに bincount）
+    out = np.empty((size, contrib.shape[1]))
+    for m in range(contrib.shape[1]):
+        out[:, m] = np.bincount(index, weights=contrib[:, m], minlength=size)
+    return out
+
+
+def train_gd_sparse(S, M=4, k=0.5, lr=0.001, E=20000, U=None, V=None, rng=None,
+                    check_every=100, tol=None, time_budget=None, callback=None):
+    # train_gd と同じ全バッチ勾配法を、観測セルだけで計算する
+    start = time.perf_counter()
+    if not isinstance(S, dict):
+        S = to_sparse(S)
+    n, D = S["shape"]
+    rows, cols, vals = S["rows"], S["cols"], S["vals"]
+    if U is None or V is None:
+        U, V = init_factors(n, D, M, rng)
+
+    curve = []
+    reason = "max_iter"
+    iterations = 0
+    while iterations < E:
+        Ur, Vc = U[rows], V[cols]
+        error = vals - np.einsum("ij,ij->i", Ur, Vc)
+        if check_every and iterations % check_every == 0:
+            curve.append((iterations, float(np.dot(error, error)) + _penalty(U, V, k)))
+            if callback:
+                callback(iterations, curve[-1][1], U, V)
+            stop = _stop_reason(curve, tol, start, None)
+            if stop:
+                reason = stop
+                break
+        gradU = 2 * _scatter_rows(rows, error[:, None] * Vc, n) - 2 * k * U
+        gradV = 2 * _scatter_rows(cols, error[:, None] * Ur, D) - 2 * k * V
+        U += lr * gradU
+        V += lr * gradV
+        iterations += 1
+        if _stop_reason([], None, start, time_budget):
+            reason = "time_budget"
+            break
+
+    return {"U": U, "V": V, "iterations": iterations, "rmse": sparse_rmse(S, U, V),
+            "loss_curve": curve, "stop_reason": reason}
+
+
+def fold_in(V, ratings, k=0.5, prior=None):
+    # 学習済みの V を固定し、新しいユーザー 1 人分の潜在ベクトルだけをリッジ回帰で解く
+    # prior を渡すと 0 ではなく prior に向けて縮小する（評価が少ないユーザー向け）
+    ratings = np.asarray(ratings, dtype=np.float64)
+    observed = ~np.isnan(ratings)
+    M = V.shape[1]
+    if prior is None:
+        prior = np.zeros(M)
+    V_o = np.asarray(V[observed], dtype=np.float64)
+    A = np.dot(V_o.T, V_o) + max(k, 1e-9) * np.eye(M)
+    b = np.dot(V_o.T, ratings[observed]) + k * prior
+    return np.linalg.solve(A, b)
+
+
+SOLVERS = {
+    "als": train_als,
+    "gd": train_gd,
+    "gd_fast": train_gd_fast,
+    "gd_sparse": train_gd_sparse,
+}
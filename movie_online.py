@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from movie_artifacts import FEEDBACK_BASE, MODEL_DIR, latest_name
+from movie_mf import fold_in
+from movie_retrieval import normalize_rows
+
+
+# ==============================================================================
+# オンライン更新
+# 送信された評価ベクトルを学習済みモデルのディレクトリに追記し、
+# そのユーザーが評価した映画の V の行だけを数ステップの SGD でその場で更新する
+# ==============================================================================
+
+def feedback_path(name, root=MODEL_DIR):
+    return os.path.join(root, name, "feedback.f32")
+
+
+def append_feedback(path, ratings):
+    # 1 行 = 映画数ぶんの float32（未評価は NaN）を追記するだけのファイル
+    row = np.asarray(ratings, dtype=np.float32)
+    with open(path, "ab") as f:
+        f.write(row.tobytes())
+
+
+def read_feedback(path, D):
+    if not os.path.exists(path):
+        return np.empty((0, D), dtype=np.float32)
+    data = np.fromfile(path, dtype=np.float32)
+    return data[:len(data) // D * D].reshape(-1, D)
+
+
+def read_all_feedback(name, D, root=MODEL_DIR):
+    # 前回までの再学習で使った評価（feedback_base.f32）と、その版で新たに届いた評価（feedback.f32）
+    base = read_feedback(os.path.join(root, name, FEEDBACK_BASE), D)
+    new = read_feedback(feedback_path(name, root), D)
+    return base, new
+
+
+class OnlineUpdater:
+    def __init__(self, name=None, root=MODEL_DIR, k=0.5, lr=0.01, steps=5, checkpoint_every=20):
+        self.name = name or latest_name(root)
+        self.path = os.path.join(root, self.name)
+        self.feedback = feedback_path(self.name, root)
+        self.k = k
+        self.lr = lr
+        self.steps = steps
+        self.checkpoint_every = checkpoint_every
+        # V.npy を書き込み可能なメモリマップで開く（読み取り専用で開いている他のプロセスにも反映される）
+        self.V = np.load(os.path.join(self.path, "V.npy"), mmap_mode="r+")
+        V_norm_path = os.path.join(self.path, "V_norm.npy")
+        self.V_norm = np.load(V_norm_path, mmap_mode="r+") if os.path.exists(V_norm_path) else None
+        U = np.load(os.path.join(self.path, "U.npy"), mmap_mode="r")
+        self.user_mean = np.asarray(U.mean(axis=0))
+        self.pending = 0
+        self._lock = threading.RLock()
+
+    def submit(self, ratings):
+        # 計算量は評価された映画の数に比例する
+        ratings = np.asarray(ratings, dtype=np.float64)
+        observed = np.flatnonzero(~np.isnan(ratings))
+        with self._lock:
+            append_feedback(self.feedback, ratings)
+            if len(observed) == 0:
+                return None
+
+            r = ratings[observed]
+            V_o = np.array(self.V[observed], dtype=np.float64)
+            u = fold_in(V_o, r, self.k, prior=self.user_mean)
+            for _ in range(self.steps):
+                error = r - np.dot(V_o, u)
+                V_o += self.lr * (error[:, None] * u - self.k * V_o)
+                u = fold_in(V_o, r, self.k, prior=self.user_mean)
+            self.V[observed] = V_o
+            if self.V_norm is not None:
+                self.V_norm[observed] = normalize_rows(V_o)
+
+            self.pending += 1
+            if self.pending >= self.checkpoint_every:
+                self._checkpoint()
+            return u
+
+    def checkpoint(self):
+        # V の変更をディスクへ書き出し、meta.json に更新回数を残す
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        self.V.flush()
+        if self.V_norm is not None:
+            self.V_norm.flush()
+        meta_path = os.path.join(self.path, "meta.json")
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["online_updates"] = meta.get("online_updates", 0) + self.pending
+        tmp = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, meta_path)
+        self.pending = 0
@@ -0,0 +1,68 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# ==============================================================================
+# 推薦結果のキャッシュ
+# キーは (データの版, モデル, 評価ベクトルのハッシュ)。同じ評価で何度送信しても、
+# 別のユーザーが同じ評価を入れても fold-in と上位 N 件の計算をやり直さない
+# 古いものから捨てる LRU で、件数は maxsize までに抑える
+# ==============================================================================
+
+def rating_hash(ratings):
+    # 未評価（NaN）と -0.0 を 1 通りの表し方にそろえてからハッシュする
+    values = np.asarray(ratings, dtype=np.float64) + 0.0
+    values = np.where(np.isnan(values), np.nan, values)
+    return hashlib.sha256(np.ascontiguousarray(values).tobytes()).hexdigest()[:16]
+
+
+class RecCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, version, model, ratings):
+        return (version, model, rating_hash(ratings))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, recs, user_vec):
+        # recs は上位 N 件（pd.Series）、user_vec は fold-in で求めたユーザーのベクトル
+        with self._lock:
+            self._entries[key] = {"recs": recs, "user_vec": user_vec}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        entry = self.get(key)
+        if entry is None:
+            recs, user_vec = compute()
+            self.put(key, recs, user_vec)
+            entry = {"recs": recs, "user_vec": user_vec}
+        return entry
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,144 @@
+import numpy as np
+
+
+# ==============================================================================
+# 上位 N 件の取得
+# 全件ソート O(D log D) ではなく argpartition O(D) で上位 k 件だけを選ぶ
+# ==============================================================================
+
+def top_k(scores, k, exclude=None):
+    # exclude（True の映画は除外）を考慮してスコア上位 k 件の (添字, スコア) を返す
+    scores = np.asarray(scores, dtype=np.float64)
+    candidates = np.arange(len(scores))
+    if exclude is not None:
+        candidates = np.flatnonzero(~np.asarray(exclude, dtype=bool))
+        scores = scores[candidates]
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    if k < len(scores):
+        part = np.argpartition(-scores, k - 1)[:k]
+    else:
+        part = np.arange(len(scores))
+    part = part[np.argsort(-scores[part], kind="stable")]
+    return candidates[part], scores[part]
+
+
+def top_k_rows(scores, k, exclude=None):
+    # 行ごとの top_k。候補が k 件に満たない行は添字 -1・スコア NaN で埋める
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude is not None:
+        scores = np.where(exclude, -np.inf, scores)
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    top = np.take_along_axis(part_scores, order, axis=1)
+    missing = np.isneginf(top)
+    idx[missing] = -1
+    top[missing] = np.nan
+    return idx, top
+
+
+# ==============================================================================
+# 映画どうしの類似度（コサイン類似度 = 行を正規化した行列の内積）
+# ==============================================================================
+
+def normalize_rows(X):
+    X = np.asarray(X, dtype=np.float64)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms > 0, norms, 1)
+
+
+def rating_columns(R):
+    # 共評価による類似度用に、映画ごとの評価列（未評価は 0）を行として並べる
+    R = np.asarray(R, dtype=np.float64)
+    return np.where(np.isnan(R), 0, R).T
+
+
+def similar_items(X_norm, item, k=5):
+    # 正規化済みの行列 X_norm に対して、行列ベクトル積 1 回で item に近い映画を求める
+    exclude = np.zeros(len(X_norm), dtype=bool)
+    exclude[item] = True
+    return top_k(np.dot(X_norm, X_norm[item]), k, exclude)
+
+
+def item_neighbors(X_norm, k=20, block=1024):
+    # 全映画の近傍 k 件の表。類似度行列はブロックごとにしか作らない
+    D = len(X_norm)
+    k = min(k, D - 1)
+    items = np.empty((D, k), dtype=np.int32)
+    scores = np.empty((D, k), dtype=np.float32)
+    for start in range(0, D, block):
+        stop = min(start + block, D)
+        sims = np.dot(X_norm[start:stop], X_norm.T)
+        self_mask = np.zeros(sims.shape, dtype=bool)
+        self_mask[np.arange(stop - start), np.arange(start, stop)] = True
+        items[start:stop], scores[start:stop] = top_k_rows(sims, k, exclude=self_mask)
+    return items, scores
+
+
+def _kmeans(X, nlist, iters=10, sample=100_000, rng=None):
+    rng = np.random.default_rng(rng)
+    if len(X) > sample:
+        X = X[rng.choice(len(X), sample, replace=False)]
+    centroids = X[rng.choice(len(X), nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest(X, centroids)
+        counts = np.bincount(assign, minlength=nlist)
+        filled = counts > 0
+        for m in range(X.shape[1]):
+            sums = np.bincount(assign, weights=X[:, m], minlength=nlist)
+            centroids[filled, m] = sums[filled] / counts[filled]
+    return centroids
+
+
+def _nearest(X, centroids, chunk=65536):
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2 の |x|^2 は比較に不要。メモリを抑えるため分割して計算する
+    norms = np.sum(centroids ** 2, axis=1)
+    assign = np.empty(len(X), dtype=np.intp)
+    for start in range(0, len(X), chunk):
+        dist = np.dot(X[start:start + chunk], centroids.T) * -2 + norms
+        assign[start:start + chunk] = np.argmin(dist, axis=1)
+    return assign
+
+
+class ItemIndex:
+    # 映画因子 V に対する検索。nlist を指定すると IVF（k-means でまとめたクラスタ）も作る
+    APPROX_THRESHOLD = 100_000
+
+    def __init__(self, V, nlist=None, rng=None):
+        self.V = np.asarray(V)
+        self.centroids = None
+        if nlist == "auto":
+            nlist = int(np.sqrt(len(self.V))) if len(self.V) >= self.APPROX_THRESHOLD else None
+        if nlist:
+            self._build_ivf(nlist, rng)
+
+    def _build_ivf(self, nlist, rng):
+        V = np.asarray(self.V, dtype=np.float64)
+        self.centroids = _kmeans(V, nlist, rng=rng)
+        assign = _nearest(V, self.centroids)
+        self.order = np.argsort(assign, kind="stable")
+        self.offsets = np.searchsorted(assign[self.order], np.arange(nlist + 1))
+        # 各クラスタの半径。v.u <= c.u + |v - c| |u| なので、クラスタ内の最大スコアの上限になる
+        dist = np.linalg.norm(V - self.centroids[assign], axis=1)
+        self.radius = np.zeros(nlist)
+        np.maximum.at(self.radius, assign, dist)
+
+    def scores(self, user_vec):
+        return np.dot(self.V, user_vec)
+
+    def search(self, user_vec, k=3, exclude=None, nprobe=None):
+        # nprobe を指定すると上限スコアの高いクラスタ nprobe 個だけを調べる（近似）
+        if self.centroids is None or nprobe is None:
+            return top_k(self.scores(user_vec), k, exclude)
+
+        bound = np.dot(self.centroids, user_vec) + self.radius * np.linalg.norm(user_vec)
+        nprobe = min(nprobe, len(bound))
+        probe = np.argpartition(-bound, nprobe - 1)[:nprobe]
+        items = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        sub_exclude = None if exclude is None else np.asarray(exclude, dtype=bool)[items]
+        idx, top = top_k(np.dot(self.V[items], user_vec), k, sub_exclude)
+        return items[idx], top
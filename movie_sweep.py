@@ -0,0 +1,144 @@
+import argparse
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from movie_data import default_source, load_ratings
+from movie_mf import train_gd_fast
+
+
+# ==============================================================================
+# ハイパーパラメータ探索: python movie_sweep.py --source movie_rate.xlsx
+# 観測された評価の一部を検証用に取り分け、(M, k, lr) の組を全コアで学習する
+# successive halving で、反復を増やすたびに検証 RMSE の悪い組を打ち切る
+# ==============================================================================
+
+def holdout_split(R, fraction=0.2, rng=None):
+    # 観測セルのうち fraction を検証用にし、学習用の行列ではその位置を NaN にする
+    rng = np.random.default_rng(rng)
+    R = np.asarray(R, dtype=np.float64)
+    rows, cols = np.nonzero(~np.isnan(R))
+    test = rng.random(len(rows)) < fraction
+    R_train = R.copy()
+    R_train[rows[test], cols[test]] = np.nan
+    return R_train, (rows[test], cols[test], R[rows[test], cols[test]])
+
+
+def make_configs(Ms, ks, lrs, samples=None, rng=None):
+    if not samples:
+        return [{"M": M, "k": k, "lr": lr} for M, k, lr in itertools.product(Ms, ks, lrs)]
+    # ランダム探索: M は候補から、k と lr は指定範囲で対数一様に選ぶ
+    rng = np.random.default_rng(rng)
+
+    def log_uniform(values):
+        lo, hi = math.log(min(values)), math.log(max(values))
+        return float(math.exp(rng.uniform(lo, hi)))
+
+    return [{"M": int(rng.choice(Ms)), "k": log_uniform(ks), "lr": log_uniform(lrs)}
+            for _ in range(samples)]
+
+
+# 各ワーカーには学習用の行列と検証セルを一度だけ渡しておく
+_worker_data = {}
+
+
+def _init_worker(R_train, test):
+    _worker_data["R_train"] = R_train
+    _worker_data["test"] = test
+
+
+def _validation_rmse(U, V, test):
+    rows, cols, vals = test
+    if len(vals) == 0:
+        return float("nan")
+    pred = np.einsum("ij,ij->i", U[rows], V[cols])
+    return float(np.sqrt(np.mean((vals - pred) ** 2)))
+
+
+def _run_trial(trial):
+    # 前の段の因子から続けて、この段の反復回数だけ学習する
+    # lr が大きすぎる組は発散するが、検証 RMSE が NaN になって最下位に回るだけなので警告は出さない
+    config = trial["config"]
+    with np.errstate(over="ignore", invalid="ignore"):
+        result = train_gd_fast(_worker_data["R_train"], M=config["M"], k=config["k"], lr=config["lr"],
+                               E=trial["epochs"], U=trial.get("U"), V=trial.get("V"),
+                               rng=trial["seed"], check_every=0)
+    rmse = _validation_rmse(result["U"], result["V"], _worker_data["test"])
+    return dict(trial, U=result["U"], V=result["V"], train_rmse=result["rmse"],
+                val_rmse=rmse, trained=trial.get("trained", 0) + trial["epochs"])
+
+
+def _rank_key(trial):
+    rmse = trial["val_rmse"]
+    return math.inf if not np.isfinite(rmse) else rmse
+
+
+def successive_halving(R, configs, min_epochs=500, max_epochs=20000, eta=3,
+                       holdout=0.2, workers=None, seed=0):
+    R_train, test = holdout_split(R, holdout, rng=seed)
+    trials = [{"id": i, "config": c, "seed": seed + i} for i, c in enumerate(configs)]
+    finished = []
+    budget, trained = min_epochs, 0
+    rung = 0
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                             initializer=_init_worker, initargs=(R_train, test)) as pool:
+        while trials:
+            epochs = min(budget, max_epochs) - trained
+            for trial in trials:
+                trial["epochs"] = epochs
+            trials = sorted(pool.map(_run_trial, trials), key=_rank_key)
+            for trial in trials:
+                trial["rung"] = rung
+
+            trained += epochs
+            if trained >= max_epochs or len(trials) == 1:
+                finished.extend(trials)
+                break
+            keep = max(1, len(trials) // eta)
+            finished.extend(trials[keep:])
+            trials = trials[:keep]
+            budget *= eta
+            rung += 1
+
+    rows = [dict(t["config"], rung=t["rung"], epochs=t["trained"],
+                 train_rmse=t["train_rmse"], val_rmse=t["val_rmse"]) for t in finished]
+    table = pd.DataFrame(rows)
+    # 長く学習した（上の段まで残った）組を先に、その中で検証 RMSE の小さい順に並べる
+    table["_rank"] = table["val_rmse"].fillna(math.inf)
+    table = table.sort_values(["rung", "_rank"], ascending=[False, True]).drop(columns="_rank")
+    return table.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="行列分解のハイパーパラメータ探索")
+    parser.add_argument("--source", default=None, help="評価データ（URL / .xlsx / .csv / .parquet）")
+    parser.add_argument("--M", type=int, nargs="+", default=[2, 4, 8], help="因子数の候補")
+    parser.add_argument("-k", type=float, nargs="+", default=[0.1, 0.5, 1.0], help="正則化係数の候補")
+    parser.add_argument("--lr", type=float, nargs="+", default=[0.0005, 0.001], help="学習率の候補")
+    parser.add_argument("--random", type=int, default=None, help="グリッドの代わりにランダムに選ぶ組の数")
+    parser.add_argument("--holdout", type=float, default=0.2, help="検証に回す評価の割合")
+    parser.add_argument("--min-epochs", type=int, default=500)
+    parser.add_argument("--max-epochs", type=int, default=20000)
+    parser.add_argument("--eta", type=int, default=3, help="各段で残す割合の逆数")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定は全コア）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="sweep_results.csv")
+    args = parser.parse_args(argv)
+
+    ratings = load_ratings(args.source or default_source())
+    configs = make_configs(args.M, args.k, args.lr, samples=args.random, rng=args.seed)
+    table = successive_halving(ratings.values, configs, min_epochs=args.min_epochs,
+                               max_epochs=args.max_epochs, eta=args.eta, holdout=args.holdout,
+                               workers=args.workers, seed=args.seed)
+    table.to_csv(args.out, index=False)
+    print(table.head(10).to_string(index=False))
+    print(f"saved {args.out} ({len(table)} configs)")
+
+
+if __name__ == "__main__":
+    main()
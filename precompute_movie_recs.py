@@ -0,0 +1,84 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+from movie_artifacts import MODEL_DIR, load_artifact, save_neighbors, save_recommendations
+from movie_data import load_ratings
+from movie_ingest import load_csr
+from movie_retrieval import item_neighbors, normalize_rows, rating_columns, top_k_rows
+
+
+# ==============================================================================
+# 既存の評価者全員の推薦表を作る: python precompute_movie_recs.py --top 10
+# 評価者 × 映画のスコア行列はブロックごとにしか作らない
+# --neighbors K を付けると「この映画に似た作品」用の近傍表も作る
+# ==============================================================================
+
+def _seen(R, start, stop, D):
+    # 評価済みのマスク。R は密な評価行列か、movie_ingest.load_csr の CSR
+    if not isinstance(R, dict):
+        return ~np.isnan(R[start:stop])
+    indptr = np.asarray(R["indptr"][start:stop + 1])
+    seen = np.zeros((stop - start, D), dtype=bool)
+    rows = np.repeat(np.arange(stop - start), np.diff(indptr))
+    seen[rows, np.asarray(R["indices"][indptr[0]:indptr[-1]])] = True
+    return seen
+
+
+def precompute(U, V, R, top=10, block=1024):
+    n = min(len(U), len(R["indptr"]) - 1 if isinstance(R, dict) else len(R))
+    items = np.empty((n, min(top, len(V))), dtype=np.int32)
+    scores = np.empty(items.shape, dtype=np.float32)
+    for start in range(0, n, block):
+        stop = min(start + block, n)
+        block_scores = np.dot(np.asarray(U[start:stop]), np.asarray(V).T)
+        seen = _seen(R, start, stop, len(V))
+        items[start:stop], scores[start:stop] = top_k_rows(block_scores, top, exclude=seen)
+    return items, scores
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="学習済みモデルから既存の評価者ごとの推薦表と映画の近傍表を作る")
+    parser.add_argument("--out", default=MODEL_DIR, help="モデルのディレクトリ")
+    parser.add_argument("--name", default=None, help="モデルの版（既定は LATEST）")
+    parser.add_argument("--source", default=None, help="評価データ（既定は学習時のデータ）")
+    parser.add_argument("--top", type=int, default=10, help="1 人あたりの推薦数")
+    parser.add_argument("--neighbors", type=int, default=0, help="映画ごとの近傍数（0 なら作らない）")
+    parser.add_argument("--similarity", choices=["factors", "ratings"], default="factors",
+                        help="近傍の類似度（因子ベクトル / 共評価の列）")
+    parser.add_argument("--block", type=int, default=1024, help="一度に計算する行数")
+    args = parser.parse_args(argv)
+
+    model = load_artifact(args.name, root=args.out)
+    if model is None:
+        parser.error(f"{args.out} に学習済みモデルがありません")
+    source = args.source or model["meta"]["source"]
+    if os.path.isdir(source):
+        # train_movie_model.py --ingested で学習したモデル（source は取り込み先のディレクトリ）
+        if args.neighbors and args.similarity == "ratings":
+            parser.error("取り込み済みのデータでは --similarity factors を使ってください")
+        R = load_csr(source)
+    else:
+        ratings = load_ratings(source)
+        R = ratings.values
+
+    start = time.perf_counter()
+    items, scores = precompute(model["U"], model["V"], R, top=args.top, block=args.block)
+    save_recommendations(model["meta"]["name"], items, scores, root=args.out)
+    print(f"saved recommendations for {len(items)} raters ({time.perf_counter() - start:.2f}s)")
+
+    if args.neighbors:
+        start = time.perf_counter()
+        if args.similarity == "ratings":
+            X_norm = normalize_rows(rating_columns(R))
+        else:
+            X_norm = model["V_norm"] if model["V_norm"] is not None else normalize_rows(model["V"])
+        items, scores = item_neighbors(np.asarray(X_norm), args.neighbors, block=args.block)
+        save_neighbors(model["meta"]["name"], items, scores, root=args.out)
+        print(f"saved {items.shape[1]} neighbors for {len(items)} movies ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,232 @@
+import os
+import time
+from functools import partial
+
 import streamlit as st
 import pandas as pd
 import numpy as np
 
+from movie_artifacts import latest_name, load_artifact, load_neighbors, load_recommendations
+from movie_data import dataset_version, load_ratings
+from movie_jobs import submit
+from movie_mf import fold_in, train_als, train_gd_fast, train_warm
+from movie_online import OnlineUpdater
+from movie_rec_cache import RecCache, rating_hash
+from movie_retrieval import normalize_rows, similar_items, top_k
+
 
-# ファイルの読み込み
-url = "https://github.com/aimathstats/dataviz1/raw/refs/heads/main/data/movie_rate.xlsx"
-real2 = pd.read_excel(url)
+# ファイルの読み込み（プロセス内キャッシュとローカルスナップショット経由）
+real2 = load_ratings()
+version = dataset_version()
 
 # 初期設定
 M = 4   # 因子数
 k = 0.5
 lr = 0.001
 E = 20000
+ALS_MAX_ITER = 100
+TOL = 1e-4          # 損失の相対改善がこれ以下になったら打ち切る
+TIME_BUDGET = 10.0  # 学習時間の上限（秒）
+DTYPE = np.dtype(os.environ.get("MOVIE_DTYPE", "float64"))  # 計算精度（float32 なら約 2 倍速く、メモリは半分）
+
+PAGE_SIZE = 20      # 1 ページに表示するスライダーの数
+REC_CACHE_SIZE = 1024  # 推薦結果を覚えておく評価ベクトルの数
+
+STOP_REASONS = {"converged": "収束", "diverged": "発散", "time_budget": "時間切れ", "max_iter": "最大反復回数"}
+
+
+# train_movie_model.py で保存した最新の因子をメモリマップで開く
+@st.cache_resource(max_entries=2)
+def load_model(name):
+    model = load_artifact(name)
+    return {
+        "U": model["U"],
+        "V": model["V"],
+        "iterations": model["meta"]["iterations"],
+        "rmse": model["meta"]["rmse"],
+        "loss_curve": model["meta"].get("loss_curve", []),
+        "stop_reason": model["meta"].get("stop_reason"),
+        "V_norm": model["V_norm"],
+        "columns": model["columns"],
+        "meta": model["meta"],
+    }
+
+
+# precompute_movie_recs.py で作った既存の評価者ごとの推薦表
+@st.cache_resource(max_entries=2)
+def load_recs(name):
+    return load_recommendations(name)
+
+
+# precompute_movie_recs.py --neighbors で作った映画ごとの近傍表
+@st.cache_resource(max_entries=2)
+def load_similar(name):
+    return load_neighbors(name)
+
+
+# 送信された評価で学習済みモデルの V を少しずつ更新する
+@st.cache_resource(max_entries=2)
+def get_updater(name):
+    return OnlineUpdater(name, k=k)
+
+
+# 同じ評価ベクトルへの推薦は全セッションで使い回す
+@st.cache_resource
+def get_rec_cache():
+    return RecCache(REC_CACHE_SIZE)
+
+
+# 既存の評価者だけで学習する（データの版が変わったときだけ再学習）
+# 学習はバックグラウンドのジョブで行い、同じ版・同じ方法なら全セッションで共有する
+# 初期値は古いモデルがあればその因子、なければ ALS は SVD、勾配法は乱数から始める
+# 同時に走る学習の数と BLAS のスレッド数は movie_jobs（MOVIE_MAX_JOBS / MOVIE_BLAS_THREADS）で決まる
+def start_training(solver, prev=None):
+    kwargs = {"R": real2.values, "M": M, "k": k, "tol": TOL, "time_budget": TIME_BUDGET, "prev": prev,
+              "dtype": DTYPE}
+    if solver == "勾配法":
+        kwargs.update(lr=lr, E=E)
+        return submit((version, "gd"), partial(train_warm, train_gd_fast, init="random"), kwargs, total=E)
+    kwargs.update(max_iter=ALS_MAX_ITER)
+    return submit((version, "als"), partial(train_warm, train_als), kwargs, total=ALS_MAX_ITER)
+
+
+# 学習済みの映画因子 V に対して、新しいユーザーのベクトルだけを解く（fold-in）
+def recommend(V, user_mean, user_series):
+    user_vec = fold_in(V, user_series.values, k=k, prior=user_mean)
+
+    # すでに評価した映画を除外して、スコアの高い上位３つを取得
+    rated = ~user_series.isna().values # 評価済みをブールで取得（~はブールの否定演算子で、T/Fを反転）
+    idx, scores = top_k(np.dot(V, user_vec), 3, exclude=rated)
+    return pd.Series(scores, index=real2.columns[idx]), user_vec
+
+
+def show_recs(recs):
+    for i, (movie, score) in enumerate(recs.items(), 1):
+        st.write(f"{i}.　{movie} ({score:.2f})")
+
 
 # 画面表示
 st.title("映画推薦システム")
 st.write("10段階で見たことある映画を評価してください")
 
 movie_list = list(real2.columns)
-user_input = {}
-
-for movie in movie_list:
-    rating = st.slider(f"{movie}", 0, 10, 0)
-    user_input[movie] = np.nan if rating == 0 else rating
-
-if st.button("推薦を表示"):
-    # 新しい行として追加
-    user_series = pd.Series(user_input) #ひとまずスライダー入力をseries形式に保存
-    real2_with_user = pd.concat([real2, user_series.to_frame().T], ignore_index=True) #Seriesをdfに変換
-
-    # 初期化
-    n, D = real2_with_user.shape
-    U = np.random.normal(1, 0.25, (n, M))
-    V = np.random.normal(1, 0.25, (D, M))
-
-    # 学習（誤差逆伝播法）
-    for _ in range(E):
-        error = real2_with_user.values - np.dot(U, V.T)
-        error[np.isnan(real2_with_user.values)] = 0
-        gradU = 2 * np.dot(error, V) - 2 * k * U
-        gradV = 2 * np.dot(error.T, U) - 2 * k * V
-        U += lr * gradU
-        V += lr * gradV
-
-    pred_matrix = np.dot(U, V.T)
-    user_pred = pd.Series(pred_matrix[-1], index=real2_with_user.columns)
-
-    # すでに評価した映画を除外
-    rated = ~user_series.isna() # 評価済みをブールで取得（~はブールの否定演算子で、T/Fを反転）
-    recs = user_pred[~rated].sort_values(ascending=False).head(3) # 未評価映画のスコアの高い順に並べ替えて、上位３つ取得して格納
+
+model_name = latest_name()
+model = load_model(model_name) if model_name else None
+stale = None
+if model is not None and model["meta"].get("dataset_version") != version:
+    # 別のデータで学習した因子はそのまま使わず、映画の並びが同じなら学習の初期値にする
+    if model["columns"] == movie_list[:len(model["columns"])]:
+        stale = model
+    model = None
+
+if model is None:
+    solver = st.radio("学習方法", ["交互最小二乗法（ALS）", "勾配法"], horizontal=True)
+else:
+    st.caption(f"学習済みモデル: {model_name}")
+
+# 評価はページをまたいで保持する（0 は未評価）
+# スライダーは映画ごとのキーを持ち、フォームを送信すると前のページの値もここで取り込まれる
+ratings = st.session_state.setdefault("ratings", {})
+for key, value in st.session_state.items():
+    if isinstance(key, str) and key.startswith("rating:"):
+        ratings[movie_list[int(key[len("rating:"):])]] = value
+
+# スライダー・検索・ページ送りはフォームにまとめ、送信したときだけ再実行する
+# 作品数が多いときは検索とページ送りで、表示中の映画だけスライダーを作る
+# （ページを移ってもそれまでのスライダーの値は保存される）
+with st.form("ratings_form"):
+    visible = list(range(len(movie_list)))
+    if len(movie_list) > PAGE_SIZE:
+        query = st.text_input("映画を検索")
+        if query:
+            visible = [j for j in visible if query.lower() in str(movie_list[j]).lower()]
+        pages = max(1, -(-len(visible) // PAGE_SIZE))
+        page = st.number_input("ページ（移動は下のボタンで）", min_value=1, value=1) if pages > 1 else 1
+        page = min(page, pages)
+        visible = visible[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+    for j in visible:
+        movie = movie_list[j]
+        st.slider(f"{movie}", 0, 10, ratings.get(movie, 0), key=f"rating:{j}")
+    col_save, col_submit = st.columns(2)
+    col_save.form_submit_button("評価を保存")
+    submitted = col_submit.form_submit_button("推薦を表示")
+
+st.caption(f"評価済み: {sum(1 for r in ratings.values() if r > 0)} 本")
+
+if submitted:
+    user_input = {movie: np.nan if ratings.get(movie, 0) == 0 else ratings[movie] for movie in movie_list}
+    st.session_state["request"] = user_input # 学習が終わるまでの再実行でも同じ入力を使う
+
+# 既存の評価者への推薦は表を番号で引くだけ
+table = load_recs(model_name) if model is not None else None
+if table is not None:
+    with st.expander("既存の評価者への推薦"):
+        rater = st.number_input("評価者の番号", min_value=0, max_value=len(table["items"]) - 1, value=0)
+        for i, (j, score) in enumerate(zip(table["items"][rater], table["scores"][rater]), 1):
+            if j >= 0:
+                st.write(f"{i}.　{movie_list[j]} ({score:.2f})")
+
+# 「この映画に似た作品」は近傍表を読むか、正規化済みの V との積 1 回で求める（再学習しない）
+if model is not None:
+    with st.expander("この映画に似た作品"):
+        base_movie = st.selectbox("映画", movie_list)
+        j = movie_list.index(base_movie)
+        neighbors = load_similar(model_name)
+        if neighbors is not None:
+            similar = zip(neighbors["items"][j][:5], neighbors["scores"][j][:5])
+        else:
+            V_norm = model["V_norm"] if model["V_norm"] is not None else normalize_rows(model["V"])
+            similar = zip(*similar_items(V_norm, j, k=5))
+        for i, (other, score) in enumerate(similar, 1):
+            if other >= 0:
+                st.write(f"{i}.　{movie_list[other]} (類似度 {score:.2f})")
+
+if st.session_state.get("request") is not None:
+    user_series = pd.Series(st.session_state["request"]) #ひとまずスライダー入力をseries形式に保存
+
+    if model is not None:
+        result = model
+    else:
+        job = start_training(solver, prev=stale)
+        if not job.done:
+            # 学習中は進捗と途中の因子による暫定の推薦を表示し、少し待ってから再実行する
+            st.progress(job.progress, text=f"学習中… {job.progress:.0%}")
+            preview = job.partial
+            if preview is not None:
+                st.subheader("暫定の推薦")
+                show_recs(recommend(preview["V"], preview["user_mean"], user_series)[0])
+                st.caption(f"反復回数: {preview['iterations']}")
+            time.sleep(0.5)
+            st.rerun()
+        if job.status == "error":
+            st.error(f"学習に失敗しました: {job.error}")
+            st.stop()
+        result = job.result
+
+    U, V = result["U"], result["V"]
+    # 版・モデル・評価が同じなら前回の結果をそのまま返す（オンライン更新による V の小さな変化は待たない）
+    rec_cache = get_rec_cache()
+    rec_key = rec_cache.key(version, model_name if model is not None else solver, user_series.values)
+    recs = rec_cache.get_or_compute(rec_key, lambda: recommend(V, U.mean(axis=0), user_series))["recs"]
 
     st.subheader("あなたに推薦の映画")
-    for i, (movie, score) in enumerate(recs.items(), 1):
-        st.write(f"{i}.　{movie} ({score:.2f})")
+    show_recs(recs)
+
+    # 推薦を表示したあとで、この評価をモデルに反映する
+    # 再実行や同じ評価での再送信では、このセッションが同じモデルに最後に送った評価と比べて二重に反映しない
+    logged = (model_name, rating_hash(user_series.values))
+    if model is not None and st.session_state.get("logged_rating") != logged:
+        get_updater(model_name).submit(user_series.values)
+        st.session_state["logged_rating"] = logged
+    reason = STOP_REASONS.get(result.get("stop_reason"), "-")
+    st.caption(f"反復回数: {result['iterations']} / RMSE: {result['rmse']:.3f} / 終了理由: {reason}")
+    if result.get("stop_reason") == "diverged":
+        st.warning("学習が発散したため、この推薦は当てになりません（学習率を下げるか ALS を使ってください）")
+    cache_stats = rec_cache.stats()
+    st.caption(f"推薦キャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']}"
+               f"（{cache_stats['size']} / {cache_stats['maxsize']} 件）")
+    if result.get("loss_curve"):
+        with st.expander("学習の経過"):
+            curve = pd.DataFrame(result["loss_curve"], columns=["反復", "損失"]).set_index("反復")
+            st.line_chart(curve)
@@ -0,0 +1,181 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from movie_artifacts import MODEL_DIR, load_artifact, save_artifact
+from movie_data import dataset_version, default_source, load_ratings
+from movie_hogwild import train_hogwild
+from movie_ingest import csr_to_sparse, load_csr
+from movie_jobs import blas_threads
+from movie_online import read_all_feedback
+from movie_mf import init_factors, svd_factors, to_sparse, train_als, train_gd_fast, train_gd_sparse, warm_factors
+
+
+# ==============================================================================
+# オフライン学習: python train_movie_model.py --source movie_rate.xlsx
+# ==============================================================================
+
+# ソルバーごとの (正則化係数, 学習率) の既定値
+SOLVER_DEFAULTS = {"als": (0.5, 0.001), "gd": (0.5, 0.001), "gd_sparse": (0.5, 0.001), "hogwild": (0.05, 0.01)}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="映画評価データで行列分解を学習し、因子を保存する")
+    parser.add_argument("--source", default=None, help="評価データ（URL / .xlsx / .csv / .parquet）")
+    parser.add_argument("--ingested", default=None,
+                        help="movie_ingest.py で取り込んだディレクトリ（gd_sparse / hogwild のみ）")
+    parser.add_argument("--out", default=MODEL_DIR, help="保存先ディレクトリ")
+    parser.add_argument("--solver", choices=["als", "gd", "gd_sparse", "hogwild"], default="als")
+    parser.add_argument("--factors", "-M", type=int, default=4, help="因子数")
+    parser.add_argument("-k", type=float, default=None,
+                        help="正則化係数（既定は hogwild なら 0.05、それ以外は 0.5）")
+    parser.add_argument("--lr", type=float, default=None,
+                        help="学習率（gd / gd_sparse / hogwild。既定は hogwild なら 0.01、それ以外は 0.001）")
+    parser.add_argument("--epochs", type=int, default=20000, help="反復回数（gd / gd_sparse）")
+    parser.add_argument("--max-iter", type=int, default=100, help="最大反復回数（als のみ）")
+    parser.add_argument("--tol", type=float, default=1e-4, help="損失の相対改善がこれ以下で打ち切る")
+    parser.add_argument("--time-budget", type=float, default=None, help="学習時間の上限（秒）")
+    parser.add_argument("--sgd-epochs", type=int, default=20, help="全評価を何周するか（hogwild のみ）")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（hogwild のみ、既定は全コア）")
+    parser.add_argument("--dtype", choices=["float64", "float32"], default="float64", help="計算精度（gd / als）")
+    parser.add_argument("--threads", type=int, default=None, help="BLAS のスレッド数（既定は環境任せ）")
+    parser.add_argument("--init", choices=["svd", "warm", "random"], default=None,
+                        help="初期値（warm は --out の最新モデルの因子から始める。既定は als なら svd、それ以外は random）")
+    parser.add_argument("--feedback", action="store_true",
+                        help="--out の最新モデルに蓄積されたアプリからの評価も学習に加える")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+    # hogwild は評価 1 件ごとに正則化をかけるので、全バッチの勾配法とは別の既定値にする
+    k, lr = SOLVER_DEFAULTS[args.solver]
+    args.k = k if args.k is None else args.k
+    args.lr = lr if args.lr is None else args.lr
+    return args
+
+
+def with_feedback(args, ratings):
+    # 前の版が引き継いだ評価と、その版に新しく届いた評価を両方使う。
+    # 使った行は新しい版の feedback_base.f32 に残すので、次の再学習でも消えず、二重にも数えない
+    empty = np.empty((0, ratings.shape[1]), dtype=np.float32)
+    prev = load_artifact(root=args.out)
+    if prev is None or prev["columns"] != [str(c) for c in ratings.columns]:
+        print("映画の並びが同じモデルがないため、蓄積された評価は使いません")
+        return ratings, empty, 0
+    base, new = read_all_feedback(prev["meta"]["name"], len(prev["columns"]), args.out)
+    rows = np.concatenate([base, new])
+    print(f"蓄積された評価 {len(rows)} 件（うち新規 {len(new)} 件）を加えます")
+    ratings = pd.concat([ratings, pd.DataFrame(rows, columns=ratings.columns, dtype=np.float64)],
+                        ignore_index=True)
+    return ratings, rows, len(new)
+
+
+def initial_factors(args, ratings):
+    # SVD の初期値で反復が減るのは ALS だけなので、勾配法系の既定は乱数
+    cold = "svd" if args.solver == "als" else "random"
+    if args.init == "warm":
+        prev = load_artifact(root=args.out)
+        columns = [str(c) for c in ratings.columns]
+        if (prev is not None and prev["U"].shape[1] == args.factors
+                and prev["columns"] == columns[:len(prev["columns"])]):
+            return warm_factors(ratings.values, prev["U"], prev["V"], args.k)
+        print(f"warm start できるモデルがないため {cold} から始めます")
+    if (cold if args.init in (None, "warm") else args.init) == "random":
+        return init_factors(*ratings.shape, args.factors, args.seed)
+    return svd_factors(ratings.values, args.factors, rng=args.seed)
+
+
+def train_ingested(args):
+    # 取り込み済みの疎行列は密にせずにそのまま学習する
+    if args.solver not in ("gd_sparse", "hogwild"):
+        raise SystemExit("--ingested は --solver gd_sparse か hogwild と一緒に使ってください")
+    csr = load_csr(args.ingested)
+    S = csr_to_sparse(csr)
+
+    start = time.perf_counter()
+    if args.solver == "hogwild":
+        result = train_hogwild(S, M=args.factors, k=args.k, lr=args.lr, epochs=args.sgd_epochs,
+                               workers=args.workers, rng=args.seed)
+        print(f"{result['ratings_per_second']:,.0f} ratings/s")
+    else:
+        result = train_gd_sparse(S, M=args.factors, k=args.k, lr=args.lr, E=args.epochs, rng=args.seed,
+                                 tol=args.tol, time_budget=args.time_budget)
+    elapsed = time.perf_counter() - start
+
+    meta = {
+        "source": args.ingested,
+        "dataset_version": csr["version"],
+        "solver": args.solver,
+        "M": args.factors,
+        "k": args.k,
+        "lr": args.lr,
+        "iterations": result["iterations"],
+        "rmse": result["rmse"],
+        "stop_reason": result.get("stop_reason"),
+        "loss_curve": result.get("loss_curve", []),
+        "train_seconds": elapsed,
+        "shape": list(csr["shape"]),
+        "nnz": len(S["vals"]),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    path = save_artifact(result["U"], result["V"], csr["movies"], meta, root=args.out)
+    print(f"saved {path} (iterations={result['iterations']}, rmse={result['rmse']:.4f}, {elapsed:.2f}s)")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.ingested:
+        return train_ingested(args)
+    source = args.source or default_source()
+    ratings = load_ratings(source)
+    version = dataset_version(source)
+    feedback, new_feedback = None, 0
+    if args.feedback:
+        ratings, feedback, new_feedback = with_feedback(args, ratings)
+
+    start = time.perf_counter()
+    U, V = initial_factors(args, ratings)
+    with blas_threads(args.threads):
+        if args.solver == "gd":
+            result = train_gd_fast(ratings.values, M=args.factors, k=args.k, lr=args.lr,
+                                   E=args.epochs, U=U, V=V, dtype=np.dtype(args.dtype),
+                                   tol=args.tol, time_budget=args.time_budget)
+        elif args.solver == "gd_sparse":
+            result = train_gd_sparse(to_sparse(ratings.values), M=args.factors, k=args.k,
+                                     lr=args.lr, E=args.epochs, U=U, V=V,
+                                     tol=args.tol, time_budget=args.time_budget)
+        elif args.solver == "hogwild":
+            result = train_hogwild(to_sparse(ratings.values), M=args.factors, k=args.k, lr=args.lr,
+                                   epochs=args.sgd_epochs, workers=args.workers, U=U, V=V, rng=args.seed)
+            print(f"{result['ratings_per_second']:,.0f} ratings/s")
+        else:
+            result = train_als(ratings.values, M=args.factors, k=args.k,
+                               max_iter=args.max_iter, tol=args.tol, U=U, V=V,
+                               time_budget=args.time_budget, dtype=np.dtype(args.dtype))
+    elapsed = time.perf_counter() - start
+
+    meta = {
+        "source": source,
+        "dataset_version": version,
+        "solver": args.solver,
+        "M": args.factors,
+        "k": args.k,
+        "lr": args.lr,
+        "dtype": args.dtype,
+        "init": args.init or ("svd" if args.solver == "als" else "random"),
+        "iterations": result["iterations"],
+        "rmse": result["rmse"],
+        "stop_reason": result.get("stop_reason"),
+        "loss_curve": result.get("loss_curve", []),
+        "train_seconds": elapsed,
+        "shape": list(ratings.shape),
+        "feedback_rows": 0 if feedback is None else len(feedback),
+        "feedback_new_rows": new_feedback,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    path = save_artifact(result["U"], result["V"], ratings.columns, meta, root=args.out, feedback=feedback)
+    print(f"saved {path} (iterations={result['iterations']}, rmse={result['rmse']:.4f}, {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()